@@ -0,0 +1,18 @@
+CREATE TABLE IF NOT EXISTS pynomina.hacienda_pub_officers_fingerprints (
+    anio INT2,
+    mes INT2,
+    rows_read INT4, -- csv rows handed to the pipeline
+    rows_rejected INT4, -- rows that failed to parse
+    rows_duplicated INT4, -- valid rows identical to another one of the period
+    num_rows INT4, -- rows stored
+    personas INT4,
+    monto_presupuestado NUMERIC,
+    monto_devengado NUMERIC,
+    row_hash NUMERIC, -- sum of the signed 64 bit md5 prefix of every row, order independent
+    dimensions JSONB, -- {column: {key: [num_rows, monto_presupuestado, monto_devengado, row_hash]}}
+    computed_at_utc TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'utc'),
+    verified_at_utc TIMESTAMP NULL,
+    verified_ok BOOLEAN NULL,
+    discrepancies JSONB NULL,
+    PRIMARY KEY (anio, mes)
+);
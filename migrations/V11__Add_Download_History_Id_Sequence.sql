@@ -0,0 +1,14 @@
+-- download_id used to be MAX + 1, which concurrent loaders race on
+CREATE SEQUENCE IF NOT EXISTS public.download_history_id_seq;
+
+SELECT SETVAL(
+    'public.download_history_id_seq',
+    COALESCE(
+        (SELECT MAX(REGEXP_REPLACE(download_id, '\D', '', 'g')::NUMERIC) FROM public.download_history),
+        0
+    )::INT8 + 1,
+    false
+);
+
+ALTER TABLE public.download_history
+    ALTER COLUMN download_id SET DEFAULT CONCAT('D', LPAD(NEXTVAL('public.download_history_id_seq')::TEXT, 7, '0'));
@@ -0,0 +1,4 @@
+-- Walks the trigram matches closest first, so a search ranks a bounded set of
+-- candidates instead of every name sharing a common word
+CREATE INDEX IF NOT EXISTS py_personas_nombre_busqueda_gist_idx
+    ON public.py_personas USING GIST (nombre_busqueda gist_trgm_ops);
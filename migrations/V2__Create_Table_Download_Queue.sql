@@ -0,0 +1,22 @@
+DO $$ BEGIN
+    CREATE TYPE public.queue_stat AS ENUM ('PENDING', 'CLAIMED', 'DONE', 'FAILED');
+EXCEPTION
+    WHEN duplicate_object THEN null;
+END $$;
+
+CREATE TABLE IF NOT EXISTS public.download_queue (
+    periodo TEXT, -- {anio}-{mes}
+    resource_url TEXT,
+    fecha_creacion TEXT NULL,
+    stat queue_stat DEFAULT 'PENDING',
+    claimed_by TEXT NULL, -- {hostname}-{pid}-{worker}
+    claimed_at TIMESTAMP NULL,
+    heartbeat_at TIMESTAMP NULL,
+    lease_until TIMESTAMP NULL,
+    attempts INT4 DEFAULT 0,
+    enqueued_at_utc TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'utc'),
+    PRIMARY KEY (periodo)
+);
+
+CREATE INDEX IF NOT EXISTS download_queue_claimable_idx
+    ON public.download_queue (stat, lease_until, periodo);
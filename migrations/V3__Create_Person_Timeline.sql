@@ -0,0 +1,46 @@
+CREATE INDEX IF NOT EXISTS hacienda_pub_officers_persona_idx
+    ON pynomina.hacienda_pub_officers (codigo_persona, anio, mes);
+
+CREATE INDEX IF NOT EXISTS hacienda_pub_officers_periodo_idx
+    ON pynomina.hacienda_pub_officers (anio, mes);
+
+CREATE TABLE IF NOT EXISTS pynomina.hacienda_pub_officers_timeline (
+    codigo_persona TEXT,
+    anio INT2,
+    mes INT2,
+    puestos INT2, -- positions held in the period
+    entidad_keys TEXT[] NULL,
+    cargos TEXT[] NULL,
+    monto_presupuestado INT8 NULL,
+    monto_devengado INT8 NULL,
+    PRIMARY KEY (codigo_persona, anio, mes),
+    CONSTRAINT fk_persona FOREIGN KEY (codigo_persona) REFERENCES public.py_personas(codigo_persona)
+);
+
+CREATE INDEX IF NOT EXISTS hacienda_pub_officers_timeline_periodo_idx
+    ON pynomina.hacienda_pub_officers_timeline (anio, mes);
+
+INSERT INTO pynomina.hacienda_pub_officers_timeline (
+    codigo_persona,
+    anio,
+    mes,
+    puestos,
+    entidad_keys,
+    cargos,
+    monto_presupuestado,
+    monto_devengado
+)
+SELECT
+    codigo_persona,
+    anio,
+    mes,
+    COUNT(1),
+    ARRAY_AGG(DISTINCT entidad_key),
+    ARRAY_AGG(DISTINCT cargo),
+    SUM(monto_presupuestado),
+    SUM(monto_devengado)
+FROM
+    pynomina.hacienda_pub_officers
+GROUP BY
+    codigo_persona, anio, mes
+ON CONFLICT (codigo_persona, anio, mes) DO NOTHING;
@@ -0,0 +1,34 @@
+DO $$ BEGIN
+    CREATE TYPE public.change_type AS ENUM ('HIRE', 'EXIT', 'TRANSFER', 'CARGO', 'SALARY');
+EXCEPTION
+    WHEN duplicate_object THEN null;
+END $$;
+
+CREATE TABLE IF NOT EXISTS pynomina.hacienda_pub_officers_snapshots (
+    anio INT2,
+    mes INT2,
+    codigo_persona TEXT,
+    entidad_keys TEXT NULL, -- sorted entidad_key joined by '|'
+    cargos TEXT NULL, -- sorted cargo joined by '|'
+    monto_devengado INT8 NULL,
+    row_hash TEXT, -- md5 of the columns above
+    PRIMARY KEY (anio, mes, codigo_persona)
+);
+
+CREATE TABLE IF NOT EXISTS pynomina.hacienda_pub_officers_changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    anio INT2,
+    mes INT2,
+    codigo_persona TEXT,
+    change_type change_type,
+    valor_anterior TEXT NULL,
+    valor_nuevo TEXT NULL,
+    monto_anterior INT8 NULL,
+    monto_nuevo INT8 NULL
+);
+
+CREATE INDEX IF NOT EXISTS hacienda_pub_officers_changes_periodo_idx
+    ON pynomina.hacienda_pub_officers_changes (anio, mes, change_type);
+
+CREATE INDEX IF NOT EXISTS hacienda_pub_officers_changes_persona_idx
+    ON pynomina.hacienda_pub_officers_changes (codigo_persona);
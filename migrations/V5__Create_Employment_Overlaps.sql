@@ -0,0 +1,22 @@
+DO $$ BEGIN
+    CREATE TYPE public.overlap_type AS ENUM ('ENTIDAD', 'OBJETO_GASTO');
+EXCEPTION
+    WHEN duplicate_object THEN null;
+END $$;
+
+CREATE TABLE IF NOT EXISTS pynomina.hacienda_pub_officers_overlaps (
+    anio INT2,
+    mes INT2,
+    codigo_persona TEXT,
+    overlap_type overlap_type,
+    num_items INT2, -- distinct entidades or objetos de gasto paying the person
+    items TEXT[],
+    monto_devengado INT8 NULL,
+    PRIMARY KEY (anio, mes, codigo_persona, overlap_type)
+);
+
+CREATE INDEX IF NOT EXISTS hacienda_pub_officers_overlaps_persona_idx
+    ON pynomina.hacienda_pub_officers_overlaps (codigo_persona);
+
+CREATE INDEX IF NOT EXISTS hacienda_pub_officers_overlaps_type_idx
+    ON pynomina.hacienda_pub_officers_overlaps (overlap_type, anio, mes);
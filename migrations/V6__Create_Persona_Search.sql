@@ -0,0 +1,24 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+ALTER TABLE public.py_personas
+    ADD COLUMN IF NOT EXISTS nombre_busqueda TEXT NULL, -- lower, unaccented "{nombres} {apellidos}"
+    ADD COLUMN IF NOT EXISTS search_tsv TSVECTOR NULL;
+
+UPDATE public.py_personas
+SET
+    nombre_busqueda = TRIM(REGEXP_REPLACE(LOWER(unaccent(CONCAT_WS(' ', nombres, apellidos))), '\s+', ' ', 'g'))
+WHERE
+    nombre_busqueda IS NULL;
+
+UPDATE public.py_personas
+SET
+    search_tsv = TO_TSVECTOR('simple', nombre_busqueda)
+WHERE
+    search_tsv IS NULL;
+
+CREATE INDEX IF NOT EXISTS py_personas_nombre_busqueda_trgm_idx
+    ON public.py_personas USING GIN (nombre_busqueda gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS py_personas_search_tsv_idx
+    ON public.py_personas USING GIN (search_tsv);
@@ -0,0 +1,68 @@
+ALTER TABLE pynomina.hacienda_pub_officers_niveles
+    ADD COLUMN IF NOT EXISTS nivel_id INT4 GENERATED BY DEFAULT AS IDENTITY;
+CREATE UNIQUE INDEX IF NOT EXISTS hacienda_pub_officers_niveles_id_idx
+    ON pynomina.hacienda_pub_officers_niveles (nivel_id);
+
+ALTER TABLE pynomina.hacienda_pub_officers_entidades
+    ADD COLUMN IF NOT EXISTS entidad_id INT4 GENERATED BY DEFAULT AS IDENTITY;
+CREATE UNIQUE INDEX IF NOT EXISTS hacienda_pub_officers_entidades_id_idx
+    ON pynomina.hacienda_pub_officers_entidades (entidad_id);
+
+ALTER TABLE pynomina.hacienda_pub_officers_programas
+    ADD COLUMN IF NOT EXISTS programa_id INT4 GENERATED BY DEFAULT AS IDENTITY;
+CREATE UNIQUE INDEX IF NOT EXISTS hacienda_pub_officers_programas_id_idx
+    ON pynomina.hacienda_pub_officers_programas (programa_id);
+
+ALTER TABLE pynomina.hacienda_pub_officers_proyectos
+    ADD COLUMN IF NOT EXISTS proyecto_id INT4 GENERATED BY DEFAULT AS IDENTITY;
+CREATE UNIQUE INDEX IF NOT EXISTS hacienda_pub_officers_proyectos_id_idx
+    ON pynomina.hacienda_pub_officers_proyectos (proyecto_id);
+
+ALTER TABLE pynomina.hacienda_pub_officers_responsables
+    ADD COLUMN IF NOT EXISTS unidad_responsable_id INT4 GENERATED BY DEFAULT AS IDENTITY;
+CREATE UNIQUE INDEX IF NOT EXISTS hacienda_pub_officers_responsables_id_idx
+    ON pynomina.hacienda_pub_officers_responsables (unidad_responsable_id);
+
+-- Rows loaded with SURROGATE_KEYS = true carry the *_id columns and leave the text *_key columns NULL
+ALTER TABLE pynomina.hacienda_pub_officers
+    ADD COLUMN IF NOT EXISTS nivel_id INT4 NULL REFERENCES pynomina.hacienda_pub_officers_niveles(nivel_id),
+    ADD COLUMN IF NOT EXISTS entidad_id INT4 NULL REFERENCES pynomina.hacienda_pub_officers_entidades(entidad_id),
+    ADD COLUMN IF NOT EXISTS programa_id INT4 NULL REFERENCES pynomina.hacienda_pub_officers_programas(programa_id),
+    ADD COLUMN IF NOT EXISTS proyecto_id INT4 NULL REFERENCES pynomina.hacienda_pub_officers_proyectos(proyecto_id),
+    ADD COLUMN IF NOT EXISTS unidad_responsable_id INT4 NULL REFERENCES pynomina.hacienda_pub_officers_responsables(unidad_responsable_id);
+
+-- Same columns as hacienda_pub_officers whatever the key mode the rows were loaded with
+CREATE OR REPLACE VIEW pynomina.hacienda_pub_officers_v AS
+SELECT
+    o.codigo_evento,
+    o.orden,
+    o.anio,
+    o.mes,
+    o.codigo_persona,
+    o.discapacidad,
+    COALESCE(o.nivel_key, n.nivel_key) AS nivel_key,
+    COALESCE(o.entidad_key, e.entidad_key) AS entidad_key,
+    COALESCE(o.programa_key, pr.programa_key) AS programa_key,
+    COALESCE(o.proyecto_key, py.proyecto_key) AS proyecto_key,
+    COALESCE(o.unidad_responsable_key, u.unidad_responsable_key) AS unidad_responsable_key,
+    o.codigo_objecto_gasto,
+    o.fuente_financiamiento,
+    o.linea,
+    o.codigo_categoria,
+    o.cargo,
+    o.horas_catedra,
+    o.fecha_ingreso,
+    o.tipo_personal,
+    o.lugar,
+    o.monto_presupuestado,
+    o.monto_devengado,
+    o.anio_corte,
+    o.mes_corte,
+    o.fecha_corte
+FROM
+    pynomina.hacienda_pub_officers o
+LEFT JOIN pynomina.hacienda_pub_officers_niveles n ON n.nivel_id = o.nivel_id
+LEFT JOIN pynomina.hacienda_pub_officers_entidades e ON e.entidad_id = o.entidad_id
+LEFT JOIN pynomina.hacienda_pub_officers_programas pr ON pr.programa_id = o.programa_id
+LEFT JOIN pynomina.hacienda_pub_officers_proyectos py ON py.proyecto_id = o.proyecto_id
+LEFT JOIN pynomina.hacienda_pub_officers_responsables u ON u.unidad_responsable_id = o.unidad_responsable_id;
@@ -0,0 +1,3 @@
+ALTER TABLE public.download_history
+    ADD COLUMN IF NOT EXISTS size_bytes INT8 NULL, -- size of the downloaded zip
+    ADD COLUMN IF NOT EXISTS elapsed_ms INT8 NULL; -- download, parse and load time
@@ -0,0 +1,8 @@
+ALTER TABLE public.download_history
+    ADD COLUMN IF NOT EXISTS error_class TEXT NULL,
+    ADD COLUMN IF NOT EXISTS error_message TEXT NULL,
+    ADD COLUMN IF NOT EXISTS attempts INT4 NULL, -- failures in a row, FAILED rows only
+    ADD COLUMN IF NOT EXISTS next_eligible_at_utc TIMESTAMP NULL; -- FAILED rows only
+
+CREATE INDEX IF NOT EXISTS download_history_resource_idx
+    ON public.download_history (resource_url, download_at_utc DESC);
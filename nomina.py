@@ -2,22 +2,33 @@ import csv
 import hashlib
 import io
 import logging
+import os
+import time
 import zipfile
-from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, fields
 from datetime import datetime as dt
-from typing import IO, List
+from datetime import timedelta, timezone
+from typing import IO, Dict, Iterator, List
 
 import psycopg
 import pydantic
-from psycopg.rows import dict_row
 from pydantic.dataclasses import dataclass
 from tqdm import tqdm
 
-from src.python.config import AppConfig, Config, NominasConf
-from src.python.httpclient import HttpClient
+from src.python.changefeed import ChangeFeed
+from src.python.channels import PERIOD_LOADED_CHANNEL
+from src.python.config import Config
+from src.python.csvreader import copy_to_tempfile, read_records
+from src.python.httpclient import CircuitOpenError
 from src.python.logger import Logger
-from src.python.pipeline import AvailableData, NominaPipeline, RawCsvItem
-from src.python.postgres import NominaPgPool
+from src.python.memory import MemoryBudget
+from src.python.overlaps import OverlapDetector
+from src.python.periods import AvailableData, PeriodIndex
+from src.python.pipeline import DimensionCatalog, NominaPipeline, RawCsvItem
+from src.python.surrogates import DimensionKeyCache
+from src.python.verification import PeriodVerifier, VerificationReport
+from src.python.workqueue import LeaseHeartbeat, LeaseLostError, PeriodWorkQueue
 
 
 @dataclass
@@ -28,168 +39,470 @@ class DownloadHistory:
     entries: int | None
     download_at_utc: dt | None
     was_succeed: bool | None
+    size_bytes: int | None = None
+    elapsed_ms: int | None = None
+    error_class: str | None = None
+    error_message: str | None = None
+    attempts: int | None = None
+    next_eligible_at_utc: dt | None = None
+
+
+def retry_delay_seconds(attempts: int, base_seconds: int, max_seconds: int) -> int:
+    """Delay before retrying a period, doubling per failed attempt up to a cap."""
+    return min(base_seconds * 2 ** (attempts - 1), max_seconds)
 
 
 class CsvHandler:
-    hash: str
+    """Reads the csv as batches of RawCsvItem, only one batch is in memory.
+
+    Batches are sized by the memory budget while reading, they shrink when
+    RSS gets close to it. ``hash`` and ``num_entries`` cover the rows read so
+    far, they are final once ``batches`` is exhausted.
+    """
+
+    batch_size = 10000
+    min_batch_size = 1000
+    max_batch_size = 100000
+
     num_entries: int
-    data: List[RawCsvItem]
+    budget: MemoryBudget | None
     log: logging.Logger
 
-    def __init__(self, csv_file: IO[bytes], encoding: str, log4py: Logger) -> None:
+    def __init__(
+        self,
+        csv_file: IO[bytes],
+        encoding: str,
+        log4py: Logger,
+        budget: MemoryBudget | None = None,
+    ) -> None:
         self.log = log4py.getLogger("CsvHandler")
-        md5sum = hashlib.md5()
+        self.budget = budget
         self.num_entries = 0
-        self.data = []
-        with io.TextIOWrapper(csv_file, encoding) as text_file:
+        self._csv_file = csv_file
+        self._encoding = encoding
+        self._md5sum = hashlib.md5()
+
+    @property
+    def hash(self) -> str:
+        return self._md5sum.hexdigest()
+
+    def batches(self) -> Iterator[List[RawCsvItem]]:
+        size = self.batch_size
+        batch: List[RawCsvItem] = []
+        with io.TextIOWrapper(self._csv_file, self._encoding) as text_file:
             csv_reader = csv.DictReader(text_file)
             for row in csv_reader:
                 self.num_entries += 1
-                md5sum.update(",".join(row.values()).encode(encoding))
+                self._md5sum.update(",".join(row.values()).encode(self._encoding))
                 try:
-                    self.data.append(RawCsvItem(**row))
+                    batch.append(RawCsvItem(**row))
                 except pydantic.ValidationError as e:
                     self.log.error(e)
+                if len(batch) >= size:
+                    yield batch
+                    batch = []
+                    if self.budget:
+                        size = self.budget.next_batch_size(
+                            size, self.min_batch_size, self.max_batch_size
+                        )
+        if batch:
+            yield batch
 
-        self.hash = md5sum.hexdigest()
 
+class ParallelCsvHandler:
+    """Same records and hash as CsvHandler, tokenized by several processes.
 
-class PyNomina:
+    The member is decompressed to a temporary file which is memory mapped and
+    split on record boundaries, rows are mapped to RawCsvItem by header index
+    instead of building a dict per row. A batch is a chunk of the file, the
+    temporary file is removed once ``batches`` is exhausted or closed.
+    """
 
-    nominas_conf: NominasConf
-    pgpool_mgr: NominaPgPool
-    client: HttpClient
+    num_entries: int
+    workers: int | None
     log: logging.Logger
 
+    def __init__(
+        self,
+        csv_file: IO[bytes],
+        encoding: str,
+        log4py: Logger,
+        workers: int | None = None,
+    ) -> None:
+        self.log = log4py.getLogger("ParallelCsvHandler")
+        self.workers = workers
+        self.num_entries = 0
+        self._csv_file = csv_file
+        self._encoding = encoding
+        self._md5sum = hashlib.md5()
+
+    @property
+    def hash(self) -> str:
+        return self._md5sum.hexdigest()
+
+    def batches(self) -> Iterator[List[RawCsvItem]]:
+        path = copy_to_tempfile(self._csv_file)
+        try:
+            header, chunks = read_records(path, self._encoding, self.workers)
+            columns = [f.name for f in fields(RawCsvItem)]
+            missing = [c for c in columns if c not in header]
+            if missing:
+                self.log.error(f"Missing columns: {missing}")
+            positions = [header.index(c) for c in columns if c not in missing]
+            for chunk in chunks:
+                batch: List[RawCsvItem] = []
+                for row in chunk:
+                    self.num_entries += 1
+                    self._md5sum.update(",".join(row).encode(self._encoding))
+                    if missing or len(row) != len(header):
+                        self.log.error(f"Malformed row: {row}")
+                        continue
+                    try:
+                        batch.append(RawCsvItem(*[row[i] for i in positions]))
+                    except pydantic.ValidationError as e:
+                        self.log.error(e)
+                yield batch
+        finally:
+            os.remove(path)
+
+
+class PyNomina(PeriodIndex):
+    """Loads the periods of the index, on top of the queries of PeriodIndex."""
+
+    work_queue: PeriodWorkQueue
+    change_feed: ChangeFeed
+    overlap_detector: OverlapDetector
+    key_cache: DimensionKeyCache
+    memory_budget: MemoryBudget
+    verifier: PeriodVerifier
+    dimension_catalog: DimensionCatalog
+
     def __init__(self, log4py: Logger, config: Config) -> None:
+        super().__init__(log4py=log4py, config=config)
         self.log = log4py.getLogger("PyNomina")
-        self.client = HttpClient(
-            default_headers={
-                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36 Edg/132.0.0.0"
-            },
-            default_timeout=5,
-            max_tries=50,
+        self.work_queue = PeriodWorkQueue(
+            pgpool_mgr=self.pgpool_mgr,
+            lease_seconds=config.nominas.lease_seconds,
             log4py=log4py,
         )
-        self.pgpool_mgr = NominaPgPool(conf=config.pg, log4py=log4py)
-        self.nominas_conf = config.nominas
+        self.change_feed = ChangeFeed(
+            salary_threshold=config.nominas.salary_change_threshold, log4py=log4py
+        )
+        self.overlap_detector = OverlapDetector(log4py=log4py)
+        self.key_cache = DimensionKeyCache(pgpool_mgr=self.pgpool_mgr, log4py=log4py)
+        self.memory_budget = MemoryBudget(
+            max_rss_mb=config.nominas.max_rss_mb, log4py=log4py
+        )
+        self.verifier = PeriodVerifier(pgpool_mgr=self.pgpool_mgr, log4py=log4py)
+        # Shared by every period loaded in this run, warm from the last one
+        self.dimension_catalog = (
+            DimensionCatalog.load(config.nominas.dimension_catalog, self.log)
+            if config.nominas.dimension_catalog
+            else DimensionCatalog()
+        )
 
-    def get_histories(self):
+    def get_failed_attempts(self, resource_url: str) -> int:
+        """Failures recorded for a resource since its last success."""
         query = """
         SELECT
-        	h.resource_url
+        	COUNT(1) AS attempts
         FROM
         	public.download_history h
         WHERE
-        	h.stat = 'SUCCEED'::public.download_stat
-        GROUP BY
-        	resource_url
+        	h.resource_url = %(resource_url)s
+        	AND h.stat = 'FAILED'::public.download_stat
+        	AND h.download_at_utc > COALESCE(
+        		(
+        			SELECT MAX(s.download_at_utc)
+        			FROM public.download_history s
+        			WHERE
+        				s.resource_url = %(resource_url)s
+        				AND s.stat = 'SUCCEED'::public.download_stat
+        		),
+        		'-infinity'::TIMESTAMP
+        	)
         """
-        with self.pgpool_mgr.get_conn() as conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                rs = cur.execute(query).fetchall()
-                return [str(r["resource_url"]) for r in rs]
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            row = cur.execute(query, {"resource_url": resource_url}).fetchone()
+            return int(row["attempts"]) if row else 0
+
+    def record_failure(self, item: AvailableData, e: Exception):
+        """Adds a FAILED row whose retry is delayed exponentially per period."""
+        attempts = self.get_failed_attempts(item.resource_url) + 1
+        delay = retry_delay_seconds(
+            attempts,
+            self.nominas_conf.retry_base_seconds,
+            self.nominas_conf.retry_max_seconds,
+        )
+        next_eligible = dt.now(timezone.utc).replace(tzinfo=None) + timedelta(
+            seconds=delay
+        )
+        self.insert_download_history(
+            DownloadHistory(
+                download_id=None,
+                resource_url=item.resource_url,
+                check_sum=None,
+                entries=None,
+                download_at_utc=None,
+                was_succeed=False,
+                error_class=type(e).__name__,
+                error_message=str(e)[:1000],
+                attempts=attempts,
+                next_eligible_at_utc=next_eligible,
+            )
+        )
+        self.log.warning(
+            f"[{item.periodo}] attempt {attempts} failed with {type(e).__name__}, "
+            f"next retry after {next_eligible:%Y-%m-%d %H:%M} UTC"
+        )
 
     def insert_download_history(self, dh: DownloadHistory):
         query = """
         INSERT INTO public.download_history (
-        	download_id,
         	resource_url,
         	check_sum,
         	entries,
+        	size_bytes,
+        	elapsed_ms,
+        	error_class,
+        	error_message,
+        	attempts,
+        	next_eligible_at_utc,
 	    	stat
         )
-        SELECT
-        	CONCAT(
-        		'D',
-        		LPAD(
-        			COALESCE(
-                        MAX(REGEXP_REPLACE(download_id, '\\D','','g')::NUMERIC) + 1,
-                        1
-                    )::TEXT,
-        			7,
-        			'0'
-        		)
-        	),
+        VALUES (
         	%(resource_url)s,
         	%(check_sum)s,
         	%(entries)s,
-	    	'SUCCEED'::public.download_stat
-        FROM
-        	public.download_history
+        	%(size_bytes)s,
+        	%(elapsed_ms)s,
+        	%(error_class)s,
+        	%(error_message)s,
+        	%(attempts)s,
+        	%(next_eligible_at_utc)s,
+	    	(CASE WHEN %(was_succeed)s THEN 'SUCCEED' ELSE 'FAILED' END)::public.download_stat
+        )
         """
         with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
             cur.execute(query, asdict(dh))
 
-    def sync_data(self):
-        try:
-            resp = self.client.get(self.nominas_conf.resource).json()
+    def load_period(
+        self, item: AvailableData, pbar: tqdm, lease: LeaseHeartbeat | None = None
+    ):
+        """Loads a period, only committing it while ``lease`` still holds the claim."""
+        anio_mes = item.periodo
+        started = time.monotonic()
+        self.memory_budget.reset_peak(anio_mes)
+        pbar.set_description(f"downloading nomina_{anio_mes}.zip")
+        with self.client.download(item.resource_url) as archive:
+            size_bytes = archive.seek(0, io.SEEK_END)
+            archive.seek(0)
+            pbar.set_description(f"[{anio_mes}] reading zip file")
+            with (
+                zipfile.ZipFile(archive) as zf,
+                zf.open(f"nomina_{anio_mes}.csv", "r") as csv_file,
+            ):
+                pbar.set_description(f"[{anio_mes}] saving csv to pg")
+                if self.nominas_conf.parallel_csv:
+                    csvHandler = ParallelCsvHandler(
+                        csv_file=csv_file, encoding="iso-8859-1", log4py=self.log4py
+                    )
+                else:
+                    csvHandler = CsvHandler(
+                        csv_file=csv_file,
+                        encoding="iso-8859-1",
+                        log4py=self.log4py,
+                        budget=self.memory_budget,
+                    )
+                pipeline = NominaPipeline(
+                    csvHandler.batches(),
+                    anio_mes,
+                    self.log4py,
+                    budget=self.memory_budget,
+                    catalog=self.dimension_catalog,
+                )
+                # Rejected rows included
+                pipeline.rows_read = csvHandler.num_entries
+        if lease:
+            lease.check()
+        key_cache = self.key_cache if self.nominas_conf.surrogate_keys else None
+        if key_cache:
+            # Before taking the load connection, it uses one of its own
+            pipeline.resolve_keys(key_cache)
+        with (
+            self.pgpool_mgr.get_conn() as conn,
+            psycopg.ClientCursor(conn) as cur,
+        ):
+            pipeline.persist_to_pg(cur, key_cache)
+            if self.nominas_conf.person_timeline:
+                pipeline.refresh_person_timeline(cur)
+            if self.nominas_conf.change_feed:
+                self.change_feed.publish(cur, anio_mes, pipeline.pub_officers)
+            if self.nominas_conf.detect_overlaps:
+                self.overlap_detector.publish(cur, anio_mes, pipeline.pub_officers)
+            self.verifier.publish(
+                cur,
+                anio_mes,
+                pipeline.pub_officers,
+                pipeline.rows_read,
+                pipeline.rows_rejected,
+                pipeline.rows_duplicated,
+            )
+            if lease:
+                # Rolls the whole period back if another worker took it over
+                lease.fence(cur)
+            # Delivered on commit, read services drop their cached results
+            cur.execute("SELECT pg_notify(%s, %s)", (PERIOD_LOADED_CHANNEL, anio_mes))
+        download_history = DownloadHistory(
+            download_id=None,
+            resource_url=item.resource_url,
+            check_sum=csvHandler.hash,
+            entries=csvHandler.num_entries,
+            download_at_utc=None,
+            was_succeed=True,
+            size_bytes=size_bytes,
+            elapsed_ms=int((time.monotonic() - started) * 1000),
+        )
+        self.insert_download_history(download_history)
+        # Pool counters are shared, they belong to the period only
+        # when it is the single one loading
+        self.pgpool_mgr.log_stats(anio_mes if self.loader_concurrency <= 1 else "pool")
+        self.memory_budget.report(anio_mes)
+
+    def reload_period(self, periodo: str):
+        """Downloads and loads one period again, whatever its history.
+
+        The period is claimed through the work queue like sync does, so it is
+        never loaded at the same time by a sync worker.
+        """
+        published = {ad.periodo: ad for ad in self.get_available_data()}
+        item = published.get(periodo) or AvailableData(
+            dataset="nomina",
+            periodo=periodo,
+            fechaCreacion="",
+            resource_url=self._resource_url(periodo),
+        )
+        self.work_queue.enqueue([item])
+        self.work_queue.requeue([periodo])
+        worker_id = PeriodWorkQueue.new_worker_id(0)
+        if (claimed := self.work_queue.claim(worker_id, periodo)) is None:
+            self.log.warning(f"[{periodo}] is being loaded by another worker")
+            return
+        with tqdm(total=1) as pbar:
+            self._load_claimed(claimed, worker_id, pbar, item.fechaCreacion or None)
+            pbar.update(1)
+
+    def verify_period(self, periodo: str) -> VerificationReport:
+        """Compares the stored rows of a period with its load fingerprint."""
+        return self.verifier.verify(periodo)
+
+    def _run_worker(self, worker: int, pbar: tqdm, published: Dict[str, str]):
+        """Loads periods claimed from the work queue until it is drained.
+
+        ``published`` maps periods to their fechaCreacion in the index, which
+        is recorded in the queue once the period is loaded.
+        """
+        worker_id = PeriodWorkQueue.new_worker_id(worker)
+        while True:
+            # Back pressure: do not pull another period while memory is short
+            self.memory_budget.wait_for_headroom(worker_id)
             try:
-                available_data = [
-                    AvailableData(
-                        **(
-                            r
-                            | {
-                                "resource_url": f"{self.nominas_conf.resource}/nomina_{r["periodo"]}.zip"
-                            }
-                        )
+                if (item := self.work_queue.claim(worker_id)) is None:
+                    break
+                try:
+                    self._load_claimed(
+                        item, worker_id, pbar, published.get(item.periodo)
                     )
-                    for r in resp
-                ]
-            except pydantic.ValidationError as e:
-                self.log.error(f"Error upon parsing: {resp}")
-                raise e
+                except CircuitOpenError as e:
+                    self.log.error(f"[{item.periodo}] {e}")
+                    break
+                except Exception:
+                    # Already logged and recorded as a failure, go on with the next
+                    pass
+            finally:
+                self.memory_budget.release(worker_id)
+            pbar.update(1)
+
+    def _load_claimed(
+        self,
+        item: AvailableData,
+        worker_id: str,
+        pbar: tqdm,
+        fecha_creacion: str | None,
+    ):
+        """Loads a period claimed by ``worker_id`` and settles its queue row."""
+        try:
+            with self.work_queue.lease(item.periodo, worker_id) as lease:
+                self.load_period(item, pbar, lease)
+            self.work_queue.complete(item.periodo, worker_id, fecha_creacion)
+        except LeaseLostError as e:
+            # Another worker owns the period now, leave the queue row alone
+            self.log.warning(str(e))
+        except CircuitOpenError:
+            # Not the period's fault, hand it back
+            self.work_queue.release(item.periodo, worker_id)
+            raise
+        except Exception as e:
+            self.log.error(f"[{item.periodo}] {e}")
+            self.record_failure(item, e)
+            self.work_queue.fail(item.periodo, worker_id)
+            raise
+
+    def sync_data(self):
+        try:
+            available_data = self.get_available_data()
             self.log.debug(f"available_data: {available_data}")
             downloaded = self.get_histories()
             self.log.debug(f"downloaded: {downloaded}")
-            pending = [ad for ad in available_data if ad.resource_url not in downloaded]
-            for item in (pbar := tqdm(pending)):
-                anio_mes = item.periodo
-                pbar.set_description(f"downloading nomina_{anio_mes}.zip")
-                try:
-                    resp = self.client.get(item.resource_url)
-                except Exception as e:
-                    self.log.error(e)
-                    continue
-                pbar.set_description(f"[{anio_mes}] reading zip file")
-                with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
-                    pbar.set_description(f"[{anio_mes}] reading csv file")
-                    with zf.open(f"nomina_{anio_mes}.csv", "r") as csv_file:
-                        csvHandler = CsvHandler(
-                            csv_file=csv_file, encoding="iso-8859-1", log4py=log4py
-                        )
-                        pbar.set_description(f"[{anio_mes}] saving csv to pg")
-                        pipeline = NominaPipeline(csvHandler.data, anio_mes, log4py)
-                        with (
-                            self.pgpool_mgr.get_conn() as conn,
-                            psycopg.ClientCursor(conn) as cur,
-                        ):
-                            pipeline.persist_to_pg(cur)
-                        download_history = DownloadHistory(
-                            download_id=None,
-                            resource_url=item.resource_url,
-                            check_sum=csvHandler.hash,
-                            entries=csvHandler.num_entries,
-                            download_at_utc=None,
-                            was_succeed=True,
-                        )
-                        self.insert_download_history(download_history)
-                # break
+            backing_off = self.get_backing_off()
+            self.log.debug(f"backing_off: {backing_off}")
+            pending = [
+                ad
+                for ad in available_data
+                if ad.resource_url not in downloaded
+                and ad.resource_url not in backing_off
+            ]
+            # Republished periods are loaded again, same rules as in plan()
+            changed = [
+                periodo
+                for periodo in self.get_changed(available_data)
+                if self._resource_url(periodo) in downloaded
+                and self._resource_url(periodo) not in backing_off
+            ]
+            self.log.debug(f"changed: {changed}")
+            self.work_queue.enqueue(pending)
+            self.work_queue.requeue(changed)
+            published = {ad.periodo: ad.fechaCreacion for ad in available_data}
+            workers = max(1, self.loader_concurrency)
+            with (
+                tqdm(total=self.work_queue.count_claimable()) as pbar,
+                ThreadPoolExecutor(max_workers=workers) as executor,
+            ):
+                futures = [
+                    executor.submit(self._run_worker, worker, pbar, published)
+                    for worker in range(workers)
+                ]
+                for future in futures:
+                    future.result()
         except Exception as e:
             self.log.error(e)
 
+    def save_dimension_catalog(self):
+        path = self.nominas_conf.dimension_catalog
+        if not path or not self.dimension_catalog.dirty:
+            return
+        try:
+            self.dimension_catalog.save(path)
+            self.log.info(f"dimension catalog saved: {self.dimension_catalog.sizes()}")
+        except OSError as e:
+            self.log.error(e)
+
     def teardown(self):
-        self.pgpool_mgr.teardown()
+        self.save_dimension_catalog()
+        super().teardown()
 
 
 if __name__ == '__main__':
-    log4py = Logger()
-    log = log4py.getLogger("Main")
-    config = AppConfig(log4py=log4py, config_file_path="config.toml").read_config()
-    pynomina = PyNomina(log4py=log4py, config=config)
-    try:
-        log.info("Welcome to pynomina")
-        pynomina.sync_data()
-    finally:
-        pynomina.teardown()
-        log.info("Left pynomina")
+    from src.python.cli import main
+
+    main()
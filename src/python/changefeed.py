@@ -0,0 +1,338 @@
+import hashlib
+import logging
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Set
+
+from psycopg import ClientCursor
+from pydantic.dataclasses import dataclass
+
+from src.python.logger import Logger
+from src.python.pipeline import PubOfficer
+
+
+@dataclass(frozen=True)
+class PersonSnapshot:
+    anio: int
+    mes: int
+    codigo_persona: str
+    entidad_keys: str
+    cargos: str
+    monto_devengado: int
+    row_hash: str
+
+
+@dataclass(frozen=True)
+class PeriodChange:
+    anio: int
+    mes: int
+    codigo_persona: str
+    change_type: str
+    valor_anterior: str | None
+    valor_nuevo: str | None
+    monto_anterior: int | None
+    monto_nuevo: int | None
+
+
+def build_snapshot(pub_officers: Iterable[PubOfficer]) -> Dict[str, PersonSnapshot]:
+    """Collapses the parsed rows of a period into one snapshot per person."""
+    entidades: Dict[str, Set[str]] = {}
+    cargos: Dict[str, Set[str]] = {}
+    montos: Dict[str, int] = {}
+    periodo: Dict[str, tuple[int, int]] = {}
+    for p in pub_officers:
+        entidades.setdefault(p.codigo_persona, set()).add(p.entidad_key or "")
+        cargos.setdefault(p.codigo_persona, set()).add(p.cargo or "")
+        montos[p.codigo_persona] = montos.get(p.codigo_persona, 0) + (
+            p.monto_devengado or 0
+        )
+        periodo[p.codigo_persona] = (p.anio, p.mes)
+
+    snapshot: Dict[str, PersonSnapshot] = {}
+    for codigo_persona, (anio, mes) in periodo.items():
+        entidad_keys = "|".join(sorted(entidades[codigo_persona]))
+        cargos_str = "|".join(sorted(cargos[codigo_persona]))
+        monto = montos[codigo_persona]
+        row_hash = hashlib.md5(
+            f"{entidad_keys}\x1f{cargos_str}\x1f{monto}".encode()
+        ).hexdigest()
+        snapshot[codigo_persona] = PersonSnapshot(
+            anio=anio,
+            mes=mes,
+            codigo_persona=codigo_persona,
+            entidad_keys=entidad_keys,
+            cargos=cargos_str,
+            monto_devengado=monto,
+            row_hash=row_hash,
+        )
+    return snapshot
+
+
+def diff_snapshots(
+    previous: Iterable[PersonSnapshot],
+    current: Dict[str, PersonSnapshot],
+    anio: int,
+    mes: int,
+    salary_threshold: float,
+) -> List[PeriodChange]:
+    """Hash-joins a streamed previous snapshot against the current one.
+
+    Only the current period is held in memory, the previous one is consumed
+    row by row. ``salary_threshold`` is the relative change of
+    ``monto_devengado`` that is reported as a salary change.
+    """
+    changes: List[PeriodChange] = []
+    seen: Set[str] = set()
+    for prev in previous:
+        curr = current.get(prev.codigo_persona)
+        if curr is None:
+            changes.append(
+                PeriodChange(
+                    anio=anio,
+                    mes=mes,
+                    codigo_persona=prev.codigo_persona,
+                    change_type="EXIT",
+                    valor_anterior=prev.entidad_keys,
+                    valor_nuevo=None,
+                    monto_anterior=prev.monto_devengado,
+                    monto_nuevo=None,
+                )
+            )
+            continue
+        seen.add(prev.codigo_persona)
+        if curr.row_hash == prev.row_hash:
+            continue
+        if curr.entidad_keys != prev.entidad_keys:
+            changes.append(
+                PeriodChange(
+                    anio=anio,
+                    mes=mes,
+                    codigo_persona=curr.codigo_persona,
+                    change_type="TRANSFER",
+                    valor_anterior=prev.entidad_keys,
+                    valor_nuevo=curr.entidad_keys,
+                    monto_anterior=prev.monto_devengado,
+                    monto_nuevo=curr.monto_devengado,
+                )
+            )
+        if curr.cargos != prev.cargos:
+            changes.append(
+                PeriodChange(
+                    anio=anio,
+                    mes=mes,
+                    codigo_persona=curr.codigo_persona,
+                    change_type="CARGO",
+                    valor_anterior=prev.cargos,
+                    valor_nuevo=curr.cargos,
+                    monto_anterior=prev.monto_devengado,
+                    monto_nuevo=curr.monto_devengado,
+                )
+            )
+        delta = abs(curr.monto_devengado - prev.monto_devengado)
+        if delta > salary_threshold * abs(prev.monto_devengado):
+            changes.append(
+                PeriodChange(
+                    anio=anio,
+                    mes=mes,
+                    codigo_persona=curr.codigo_persona,
+                    change_type="SALARY",
+                    valor_anterior=None,
+                    valor_nuevo=None,
+                    monto_anterior=prev.monto_devengado,
+                    monto_nuevo=curr.monto_devengado,
+                )
+            )
+
+    for codigo_persona, curr in current.items():
+        if codigo_persona in seen:
+            continue
+        changes.append(
+            PeriodChange(
+                anio=anio,
+                mes=mes,
+                codigo_persona=codigo_persona,
+                change_type="HIRE",
+                valor_anterior=None,
+                valor_nuevo=curr.entidad_keys,
+                monto_anterior=None,
+                monto_nuevo=curr.monto_devengado,
+            )
+        )
+    return changes
+
+
+class ChangeFeed:
+    """Publishes the month over month delta of every loaded period.
+
+    Periods are loaded in any order by concurrent workers, so the feed of a
+    period is written by whichever of it and its previous period commits
+    last: publishing a period diffs it against the previous snapshot when
+    there is one, and rewrites the feed of the next period when that one is
+    already loaded. Adjacent periods are serialized with transaction advisory
+    locks on the pairs a period belongs to, (previous, period) and (period,
+    next), so they never miss each other's snapshot while periods further
+    apart publish concurrently.
+    """
+
+    salary_threshold: float
+    log: logging.Logger
+
+    def __init__(self, salary_threshold: float, log4py: Logger) -> None:
+        self.log = log4py.getLogger("ChangeFeed")
+        self.salary_threshold = salary_threshold
+
+    @staticmethod
+    def previous_period(anio: int, mes: int) -> tuple[int, int]:
+        return (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+
+    @staticmethod
+    def next_period(anio: int, mes: int) -> tuple[int, int]:
+        return (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+    @staticmethod
+    def pair_lock_keys(anio: int, mes: int) -> List[int]:
+        """Advisory lock keys of the pairs (previous, period) and (period, next).
+
+        A pair is keyed by its later month, in ascending order so concurrent
+        publications always take them in the same order.
+        """
+        month = anio * 12 + mes - 1
+        return [month, month + 1]
+
+    def _stream_snapshot(self, cur: ClientCursor, anio: int, mes: int):
+        query = """
+        SELECT
+            anio,
+            mes,
+            codigo_persona,
+            entidad_keys,
+            cargos,
+            monto_devengado,
+            row_hash
+        FROM
+            pynomina.hacienda_pub_officers_snapshots
+        WHERE
+            anio = %(anio)s AND mes = %(mes)s
+        """
+        with cur.connection.cursor(name=f"snapshot_{anio}_{mes}") as snap_cur:
+            snap_cur.itersize = 10000
+            for row in snap_cur.execute(query, {"anio": anio, "mes": mes}):
+                yield PersonSnapshot(**row)
+
+    def _has_snapshot(self, cur: ClientCursor, anio: int, mes: int) -> bool:
+        query = """
+        SELECT 1 FROM pynomina.hacienda_pub_officers_snapshots
+        WHERE anio = %(anio)s AND mes = %(mes)s LIMIT 1
+        """
+        return cur.execute(query, {"anio": anio, "mes": mes}).fetchone() is not None
+
+    def _is_claimed(self, cur: ClientCursor, anio: int, mes: int) -> bool:
+        query = """
+        SELECT 1 FROM public.download_queue
+        WHERE periodo = %(periodo)s AND stat = 'CLAIMED'::public.queue_stat
+        """
+        return (
+            cur.execute(query, {"periodo": f"{anio}-{mes:02}"}).fetchone() is not None
+        )
+
+    def _save_changes(
+        self, cur: ClientCursor, anio: int, mes: int, changes: List[PeriodChange]
+    ):
+        clean_changes = """
+        DELETE FROM pynomina.hacienda_pub_officers_changes WHERE anio = %(anio)s AND mes = %(mes)s
+        """
+        insert_change = """
+        INSERT INTO pynomina.hacienda_pub_officers_changes (
+            anio,
+            mes,
+            codigo_persona,
+            change_type,
+            valor_anterior,
+            valor_nuevo,
+            monto_anterior,
+            monto_nuevo
+        )
+        VALUES (
+            %(anio)s, %(mes)s, %(codigo_persona)s, %(change_type)s::public.change_type,
+            %(valor_anterior)s, %(valor_nuevo)s, %(monto_anterior)s, %(monto_nuevo)s
+        )
+        """
+        cur.execute(clean_changes, {"anio": anio, "mes": mes})
+        cur.executemany(insert_change, [asdict(c) for c in changes])
+        self.log.info(f"[{anio}-{mes:02}] published {len(changes)} changes")
+
+    def publish(
+        self, cur: ClientCursor, anio_mes: str, pub_officers: Iterable[PubOfficer]
+    ) -> List[PeriodChange]:
+        anio, mes = (int(p) for p in anio_mes.split("-"))
+        current = build_snapshot(pub_officers)
+        # Held until the load commits, see the class docstring
+        for key in self.pair_lock_keys(anio, mes):
+            cur.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('pynomina.change_feed'), %s::INT4)",
+                (key,),
+            )
+
+        clean_snapshot = """
+        DELETE FROM pynomina.hacienda_pub_officers_snapshots WHERE anio = %(anio)s AND mes = %(mes)s
+        """
+        insert_snapshot = """
+        INSERT INTO pynomina.hacienda_pub_officers_snapshots (
+            anio,
+            mes,
+            codigo_persona,
+            entidad_keys,
+            cargos,
+            monto_devengado,
+            row_hash
+        )
+        VALUES (
+            %(anio)s, %(mes)s, %(codigo_persona)s, %(entidad_keys)s,
+            %(cargos)s, %(monto_devengado)s, %(row_hash)s
+        )
+        """
+        cur.execute(clean_snapshot, {"anio": anio, "mes": mes})
+        cur.executemany(insert_snapshot, [asdict(s) for s in current.values()])
+
+        changes: List[PeriodChange] = []
+        prev_anio, prev_mes = self.previous_period(anio, mes)
+        if self._has_snapshot(cur, prev_anio, prev_mes):
+            changes = diff_snapshots(
+                self._stream_snapshot(cur, prev_anio, prev_mes),
+                current,
+                anio,
+                mes,
+                self.salary_threshold,
+            )
+        elif self._is_claimed(cur, prev_anio, prev_mes):
+            self.log.info(
+                f"[{anio_mes}] {prev_anio}-{prev_mes:02} is being loaded, "
+                "its publication will write this change feed"
+            )
+        else:
+            self.log.info(
+                f"[{anio_mes}] no snapshot for {prev_anio}-{prev_mes:02}, "
+                "skipping change feed"
+            )
+        self._save_changes(cur, anio, mes, changes)
+
+        # The next period may have been loaded first, or against an older
+        # version of this one
+        next_anio, next_mes = self.next_period(anio, mes)
+        if self._has_snapshot(cur, next_anio, next_mes):
+            following = {
+                s.codigo_persona: s
+                for s in self._stream_snapshot(cur, next_anio, next_mes)
+            }
+            self._save_changes(
+                cur,
+                next_anio,
+                next_mes,
+                diff_snapshots(
+                    current.values(),
+                    following,
+                    next_anio,
+                    next_mes,
+                    self.salary_threshold,
+                ),
+            )
+        return changes
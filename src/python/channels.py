@@ -0,0 +1,2 @@
+# Channel the loader notifies with the period (YYYY-MM) it just committed
+PERIOD_LOADED_CHANNEL = "nomina_period_loaded"
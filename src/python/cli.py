@@ -0,0 +1,253 @@
+"""Command line entry point.
+
+Only the standard library is imported at module level, psycopg, pydantic,
+requests and tqdm are imported by the subcommand that needs them so that
+``--help`` and cheap commands start fast. Only ``sync`` and ``reload`` import
+the loader (``nomina``), the other subcommands import their queries alone.
+"""
+
+import argparse
+import json
+import sys
+from dataclasses import asdict
+from typing import TYPE_CHECKING, List
+
+from src.python.config import AppConfig, Config
+from src.python.logger import Logger
+
+if TYPE_CHECKING:
+    from nomina import PyNomina
+    from src.python.postgres import NominaPgPool
+
+
+def _pynomina(log4py: Logger, config: Config) -> "PyNomina":
+    from nomina import PyNomina
+
+    return PyNomina(log4py=log4py, config=config)
+
+
+def _pgpool(
+    log4py: Logger, config: Config, pool_size: int | None = None
+) -> "NominaPgPool":
+    from src.python.postgres import NominaPgPool
+
+    return NominaPgPool(conf=config.pg, log4py=log4py, pool_size=pool_size)
+
+
+def sync(args: argparse.Namespace, log4py: Logger, config: Config):
+    pynomina = _pynomina(log4py, config)
+    try:
+        pynomina.sync_data()
+    finally:
+        pynomina.teardown()
+
+
+def plan(args: argparse.Namespace, log4py: Logger, config: Config):
+    from src.python.periods import PeriodIndex
+
+    index = PeriodIndex(log4py=log4py, config=config)
+    try:
+        items = index.plan(with_sizes=args.sizes)
+    finally:
+        index.teardown()
+    total_bytes = sum(i.expected_bytes or 0 for i in items)
+    total_seconds = sum(i.estimated_seconds or 0 for i in items)
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "periods": [vars(i) for i in items],
+                    "expected_bytes": total_bytes,
+                    "estimated_seconds": total_seconds,
+                }
+            )
+        )
+        return
+    for i in items:
+        size = f"{i.expected_bytes / 1024 / 1024:.1f}MB" if i.expected_bytes else "?"
+        eta = f"{i.estimated_seconds:.0f}s" if i.estimated_seconds else "?"
+        print(f"{i.periodo}\t{i.reason}\t{size}\t{eta}")
+    print(
+        f"{len(items)} periods, {total_bytes / 1024 / 1024:.1f}MB, "
+        f"~{total_seconds / 60:.1f} min"
+    )
+
+
+def reload(args: argparse.Namespace, log4py: Logger, config: Config):
+    pynomina = _pynomina(log4py, config)
+    try:
+        for periodo in args.periods:
+            pynomina.reload_period(periodo)
+    finally:
+        pynomina.teardown()
+
+
+def verify(args: argparse.Namespace, log4py: Logger, config: Config) -> int:
+    from src.python.verification import PeriodVerifier
+
+    pgpool_mgr = _pgpool(log4py, config)
+    failed = 0
+    try:
+        verifier = PeriodVerifier(pgpool_mgr=pgpool_mgr, log4py=log4py)
+        for report in verifier.verify_all(args.periods, config.pg.loader_concurrency):
+            failed += 0 if report.status == "OK" else 1
+            print(json.dumps(asdict(report), ensure_ascii=False))
+    finally:
+        pgpool_mgr.teardown()
+    return 1 if failed else 0
+
+
+def export(args: argparse.Namespace, log4py: Logger, config: Config):
+    from src.python.periods import export_period
+
+    pgpool_mgr = _pgpool(log4py, config)
+    try:
+        if args.output == "-":
+            export_period(pgpool_mgr, args.period, sys.stdout.buffer)
+        else:
+            with open(args.output, "wb") as output:
+                export_period(pgpool_mgr, args.period, output)
+    finally:
+        pgpool_mgr.teardown()
+
+
+def timeline(args: argparse.Namespace, log4py: Logger, config: Config):
+    from src.python.timeline import PersonTimeline
+
+    pgpool_mgr = _pgpool(log4py, config)
+    try:
+        person_timeline = PersonTimeline(pgpool_mgr=pgpool_mgr, log4py=log4py)
+        if args.compact:
+            result = person_timeline.get_periods(args.codigos)
+        else:
+            result = person_timeline.get_positions(args.codigos)
+        for entries in result.values():
+            for entry in entries:
+                print(json.dumps(asdict(entry), default=str, ensure_ascii=False))
+    finally:
+        pgpool_mgr.teardown()
+
+
+def search(args: argparse.Namespace, log4py: Logger, config: Config):
+    from src.python.search import PersonaSearch
+
+    pgpool_mgr = _pgpool(log4py, config)
+    try:
+        page = PersonaSearch(pgpool_mgr=pgpool_mgr, log4py=log4py).search(
+            " ".join(args.text), limit=args.limit
+        )
+        for match in page.matches:
+            print(json.dumps(asdict(match), ensure_ascii=False))
+    finally:
+        pgpool_mgr.teardown()
+
+
+def overlaps(args: argparse.Namespace, log4py: Logger, config: Config):
+    from src.python.overlaps import OverlapDetector
+
+    workers = args.workers or config.pg.loader_concurrency
+    # One pooled connection per backfill worker
+    pgpool_mgr = _pgpool(log4py, config, pool_size=workers)
+    try:
+        OverlapDetector(log4py=log4py).backfill(
+            pgpool_mgr,
+            workers=workers,
+            periods=[
+                (int(anio), int(mes))
+                for anio, mes in (p.split("-") for p in args.periods)
+            ],
+        )
+    finally:
+        pgpool_mgr.teardown()
+
+
+def serve(args: argparse.Namespace, log4py: Logger, config: Config):
+    from src.python.readservice import serve as serve_queries
+
+    serve_queries(args.host, args.port, args.config, args.max_entries, args.pool_size)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="pynomina")
+    parser.add_argument("--config", default="config.toml")
+    commands = parser.add_subparsers(dest="command")
+
+    cmd = commands.add_parser("sync", help="load every pending period")
+    cmd.set_defaults(func=sync)
+
+    cmd = commands.add_parser("plan", help="show what sync would load, dry run")
+    cmd.add_argument(
+        "--sizes", action="store_true", help="ask the server for archive sizes"
+    )
+    cmd.add_argument("--json", action="store_true")
+    cmd.set_defaults(func=plan)
+
+    cmd = commands.add_parser("reload", help="download and load periods again")
+    cmd.add_argument("periods", nargs="+", metavar="PERIOD", help="YYYY-MM")
+    cmd.set_defaults(func=reload)
+
+    cmd = commands.add_parser("verify", help="check loaded periods")
+    cmd.add_argument(
+        "periods", nargs="*", metavar="PERIOD", help="YYYY-MM, all loaded if empty"
+    )
+    cmd.set_defaults(func=verify)
+
+    cmd = commands.add_parser("export", help="write a loaded period as CSV")
+    cmd.add_argument("period", metavar="PERIOD", help="YYYY-MM")
+    cmd.add_argument("-o", "--output", default="-", help="file, stdout by default")
+    cmd.set_defaults(func=export)
+
+    cmd = commands.add_parser("timeline", help="positions of people over time")
+    cmd.add_argument("codigos", nargs="+", metavar="CODIGO", help="codigo_persona")
+    cmd.add_argument(
+        "--compact",
+        action="store_true",
+        help="one row per person and period, requires PERSON_TIMELINE",
+    )
+    cmd.set_defaults(func=timeline)
+
+    cmd = commands.add_parser("search", help="search people by name")
+    cmd.add_argument("text", nargs="+", help="partial names, accents optional")
+    cmd.add_argument("--limit", type=int, default=20)
+    cmd.set_defaults(func=search)
+
+    cmd = commands.add_parser(
+        "overlaps", help="backfill multi entity employment findings"
+    )
+    cmd.add_argument(
+        "periods", nargs="*", metavar="PERIOD", help="YYYY-MM, all loaded if empty"
+    )
+    cmd.add_argument("--workers", type=int, default=None)
+    cmd.set_defaults(func=overlaps)
+
+    cmd = commands.add_parser("serve", help="cached read only query service")
+    cmd.add_argument("--host", default="127.0.0.1")
+    cmd.add_argument("--port", type=int, default=8080)
+    cmd.add_argument("--max-entries", type=int, default=1024)
+    cmd.add_argument(
+        "--pool-size",
+        type=int,
+        default=10,
+        help="connections for cache misses, LOADER_CONCURRENCY does not apply",
+    )
+    cmd.set_defaults(func=serve)
+    return parser
+
+
+def main(argv: List[str] | None = None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        args = build_parser().parse_args(["--config", args.config, "sync"])
+
+    log4py = Logger()
+    log = log4py.getLogger("Main")
+    config = AppConfig(log4py=log4py, config_file_path=args.config).read_config()
+    log.info("Welcome to pynomina")
+    try:
+        sys.exit(args.func(args, log4py, config) or 0)
+    finally:
+        log.info("Left pynomina")
+
+
+if __name__ == '__main__':
+    main()
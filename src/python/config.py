@@ -16,6 +16,11 @@ class PGConf:
     password: str
     connect_timeout: int
     application_name: str
+    loader_concurrency: int
+    pool_max_waiting: int
+    pool_timeout: float
+    synchronous_commit: str
+    work_mem: str
 
 
 @dataclass
@@ -23,6 +28,20 @@ class NominasConf:
     resource: str
     # st_month_year: str
     force_download: bool
+    lease_seconds: int
+    person_timeline: bool
+    change_feed: bool
+    salary_change_threshold: float
+    detect_overlaps: bool
+    surrogate_keys: bool
+    max_rss_mb: int
+    parallel_csv: bool
+    dimension_catalog: str
+    max_tries: int
+    retry_base_seconds: int
+    retry_max_seconds: int
+    circuit_failures: int
+    circuit_cooldown_seconds: int
 
 
 @dataclass
@@ -55,12 +74,31 @@ class AppConfig:
             password=read_pg.get("PASS", "postgres"),
             connect_timeout=read_pg.get("CONN_TIMEOUT", 10),
             application_name=read_app.get("APP_NAME", "nominas-py"),
+            loader_concurrency=read_app.get("LOADER_CONCURRENCY", 1),
+            pool_max_waiting=read_pg.get("POOL_MAX_WAITING", 10),
+            pool_timeout=read_pg.get("POOL_TIMEOUT", 30.0),
+            synchronous_commit=read_pg.get("SYNCHRONOUS_COMMIT", "off"),
+            work_mem=read_pg.get("WORK_MEM", "64MB"),
         )
         read_nomina = read.get("nominas", {})
         nomina_conf = NominasConf(
             resource=read_nomina.get("RESOURCE", self.default_resource),
             # st_month_year=read_nomina.get("ST_MONTH_YEAR", "2013-01"),
             force_download=read_nomina.get("FORCE_DOWNLOAD", False),
+            lease_seconds=read_nomina.get("LEASE_SECONDS", 600),
+            person_timeline=read_nomina.get("PERSON_TIMELINE", False),
+            change_feed=read_nomina.get("CHANGE_FEED", False),
+            salary_change_threshold=read_nomina.get("SALARY_CHANGE_THRESHOLD", 0.1),
+            detect_overlaps=read_nomina.get("DETECT_OVERLAPS", False),
+            surrogate_keys=read_nomina.get("SURROGATE_KEYS", False),
+            max_rss_mb=read_nomina.get("MAX_RSS_MB", 0),
+            parallel_csv=read_nomina.get("PARALLEL_CSV", False),
+            dimension_catalog=read_nomina.get("DIMENSION_CATALOG", ""),
+            max_tries=read_nomina.get("MAX_TRIES", 3),
+            retry_base_seconds=read_nomina.get("RETRY_BASE_SECONDS", 900),
+            retry_max_seconds=read_nomina.get("RETRY_MAX_SECONDS", 7 * 24 * 3600),
+            circuit_failures=read_nomina.get("CIRCUIT_FAILURES", 5),
+            circuit_cooldown_seconds=read_nomina.get("CIRCUIT_COOLDOWN_SECONDS", 300),
         )
         conf: Config = Config(pg=pgconf, nominas=nomina_conf)
         self.log.debug(f"read config: {conf}")
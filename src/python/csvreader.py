@@ -0,0 +1,156 @@
+import csv
+import io
+import mmap
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import cpu_count, get_context
+from typing import IO, Deque, Iterator, List, Tuple
+
+# Chunks smaller than this are not worth a round trip to a worker process
+MIN_CHUNK_BYTES = 8 * 1024 * 1024
+# Chunks submitted ahead of the consumer, per worker process
+MAX_CHUNKS_PER_WORKER = 2
+QUOTE = ord('"')
+NEWLINE = ord("\n")
+
+
+def _next_record_boundary(mm: mmap.mmap, start: int, pos: int) -> int:
+    """First offset >= pos right after a newline that is not inside quotes.
+
+    ``start`` must be a record boundary. Escaped quotes are doubled in CSV,
+    so the quote parity between ``start`` and a newline tells whether that
+    newline ends a record.
+    """
+    quotes = mm[start:pos].count(QUOTE)
+    while True:
+        newline = mm.find(b"\n", pos)
+        if newline == -1:
+            return len(mm)
+        quotes += mm[pos:newline].count(QUOTE)
+        pos = newline + 1
+        if quotes % 2 == 0:
+            return pos
+
+
+def split_records(mm: mmap.mmap, start: int, num_chunks: int) -> List[Tuple[int, int]]:
+    """Splits ``mm[start:]`` in byte ranges that hold whole records."""
+    size = len(mm)
+    chunk_size = max(MIN_CHUNK_BYTES, (size - start) // max(1, num_chunks) + 1)
+    ranges: List[Tuple[int, int]] = []
+    while start < size:
+        end = _next_record_boundary(mm, start, min(size, start + chunk_size))
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+class SplitError(Exception):
+    """A chunk did not end on a record boundary, see ``tokenize_range``."""
+
+
+def tokenize_range(
+    path: str, start: int, end: int, encoding: str
+) -> List[Tuple[str, ...]]:
+    """Parses the records in ``[start, end)`` of the file, skipping blank rows.
+
+    A stray quote inside an unquoted field, which csv.reader takes as a
+    literal, breaks the quote parity used to split the file, so a chunk may
+    end inside a quoted field. The reader is strict to notice it: the chunk
+    then raises SplitError instead of returning wrong records.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # newline=None translates line endings like io.TextIOWrapper does
+        text = io.StringIO(mm[start:end].decode(encoding), newline=None)
+        try:
+            return [tuple(row) for row in csv.reader(text, strict=True) if row]
+        except csv.Error as e:
+            raise SplitError(f"bytes {start}-{end}: {e}") from e
+
+
+def tokenize_serial(
+    path: str, start: int, encoding: str, batch_size: int = 10000
+) -> Iterator[List[Tuple[str, ...]]]:
+    """Parses the file from ``start`` to the end in one pass, like DictReader."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        with io.TextIOWrapper(f, encoding) as text:
+            batch: List[Tuple[str, ...]] = []
+            for row in csv.reader(text):
+                if row:
+                    batch.append(tuple(row))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+
+def read_header(mm: mmap.mmap, encoding: str) -> Tuple[List[str], int]:
+    end = _next_record_boundary(mm, 0, 0)
+    text = io.StringIO(mm[:end].decode(encoding), newline=None)
+    return next(csv.reader(text)), end
+
+
+def copy_to_tempfile(member: IO[bytes]) -> str:
+    """Decompresses a zip member to a temporary file, the caller removes it."""
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(fd, "wb") as output:
+        shutil.copyfileobj(member, output, length=MIN_CHUNK_BYTES)
+    return path
+
+
+def read_records(
+    path: str, encoding: str, workers: int | None = None
+) -> Tuple[List[str], Iterator[List[Tuple[str, ...]]]]:
+    """Returns the header and the records of a CSV file, chunk by chunk.
+
+    The file is memory mapped, split on record boundaries and every chunk is
+    tokenized by a worker process. Chunks are yielded in file order. When a
+    chunk turns out to be split inside a record, everything from its start
+    is tokenized serially instead; the chunks before it ended cleanly on
+    boundaries, so their records are right.
+    """
+    workers = workers or cpu_count()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return [], iter([])
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header, body_start = read_header(mm, encoding)
+            ranges = split_records(mm, body_start, workers * 4)
+
+    def chunks() -> Iterator[List[Tuple[str, ...]]]:
+        # Loaders call this from threads, and forking a multi-threaded
+        # process may deadlock the child
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("forkserver")
+        ) as executor:
+            pending = iter(ranges)
+            in_flight: Deque[Tuple[int, Future[List[Tuple[str, ...]]]]] = deque()
+            while True:
+                # Only a few tokenized chunks wait for the consumer at a time
+                while len(in_flight) < workers * MAX_CHUNKS_PER_WORKER:
+                    if (chunk_range := next(pending, None)) is None:
+                        break
+                    start, end = chunk_range
+                    in_flight.append(
+                        (
+                            start,
+                            executor.submit(tokenize_range, path, start, end, encoding),
+                        )
+                    )
+                if not in_flight:
+                    return
+                start, future = in_flight.popleft()
+                try:
+                    chunk = future.result()
+                except SplitError:
+                    for _, f in in_flight:
+                        f.cancel()
+                    yield from tokenize_serial(path, start, encoding)
+                    return
+                yield chunk
+
+    return header, chunks()
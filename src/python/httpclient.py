@@ -1,4 +1,8 @@
 import logging
+import tempfile
+import threading
+import time
+from typing import IO
 
 import backoff
 import requests
@@ -6,11 +10,98 @@ import requests
 from src.python.logger import Logger
 
 
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host that keeps failing."""
+
+
+class CircuitBreaker:
+    """Stops calling the upstream host after consecutive failures.
+
+    After ``failure_threshold`` connection errors, timeouts or 5xx responses
+    in a row every call fails fast for ``cooldown_seconds``, then a single
+    call is let through to probe the host again. The others keep failing fast
+    until the probe records its outcome.
+    """
+
+    failure_threshold: int
+    cooldown_seconds: float
+    _failures: int
+    _opened_at: float | None
+    _probing: bool
+    _lock: threading.Lock
+    log: logging.Logger
+
+    def __init__(
+        self, failure_threshold: int, cooldown_seconds: float, log4py: Logger
+    ) -> None:
+        self.log = log4py.getLogger("CircuitBreaker")
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                raise CircuitOpenError(
+                    f"upstream failed {self._failures} times in a row, "
+                    f"waiting {self.cooldown_seconds:.0f}s"
+                )
+            if self._probing:
+                raise CircuitOpenError("upstream is being probed by another call")
+            # Half open, let this call probe the host
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._probing = False
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self.log.warning(f"circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Ends a probe that said nothing about the host, e.g. a 4xx, the
+        next call probes again."""
+        with self._lock:
+            self._probing = False
+
+
+def is_upstream_failure(e: Exception) -> bool:
+    """Connection problems and 5xx responses, the host is to blame."""
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code >= 500
+    return isinstance(
+        e,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ),
+    )
+
+
 class HttpClient:
 
+    # Downloads bigger than this are spooled to disk instead of memory
+    spool_max_bytes = 8 * 1024 * 1024
+    chunk_bytes = 1024 * 1024
+
     default_headers: dict[str, str]
     default_timeout: int
     max_tries: int
+    circuit_breaker: CircuitBreaker
     log: logging.Logger
 
     def __init__(
@@ -19,32 +110,99 @@ class HttpClient:
         default_headers: dict[str, str],
         default_timeout: int,
         max_tries: int,
+        circuit_breaker: CircuitBreaker | None = None,
     ) -> None:
         self.log = log4py.getLogger("HttpClient")
         self.default_headers = default_headers
         self.default_timeout = default_timeout
         self.max_tries = max_tries
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            failure_threshold=5, cooldown_seconds=300, log4py=log4py
+        )
 
     def _get_max_tries(self):
         return self.max_tries  # Returns instance-specific max_tries
 
     def get(self, url: str, headers: dict[str, str] | None = None):
+        """GETs the url, retrying only transient upstream failures.
+
+        4xx responses (e.g. a missing archive) raise right away, every call
+        raises CircuitOpenError while the circuit breaker is open.
+        """
         decorated_get_request = backoff.on_exception(
             wait_gen=backoff.expo,
-            exception=Exception,
+            exception=requests.RequestException,
             max_tries=self._get_max_tries(),
+            giveup=lambda e: not is_upstream_failure(e),
         )(self._get_request)
 
         return decorated_get_request(url, headers or {})
 
-    def _get_request(self, url: str, headers: dict[str, str]):
+    def download(self, url: str) -> IO[bytes]:
+        """Streams the body of the url to a temporary file, rewound.
+
+        Small bodies stay in memory, bigger ones go to disk, so an archive is
+        never held whole in memory. Retries like ``get``, a download cut
+        halfway starts over. The caller closes the file.
+        """
+        decorated_download = backoff.on_exception(
+            wait_gen=backoff.expo,
+            exception=requests.RequestException,
+            max_tries=self._get_max_tries(),
+            giveup=lambda e: not is_upstream_failure(e),
+        )(self._download)
+
+        return decorated_download(url)
+
+    def _download(self, url: str) -> IO[bytes]:
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes)
+        try:
+            with self._get_request(url, {}, stream=True) as response:
+                try:
+                    for chunk in response.iter_content(self.chunk_bytes):
+                        spool.write(chunk)
+                except requests.RequestException as e:
+                    self.log.error(f"Download failed: {e}")
+                    if is_upstream_failure(e):
+                        self.circuit_breaker.record_failure()
+                    raise
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+
+    def content_length(self, url: str) -> int | None:
+        """Size announced by a HEAD request, single try and no backoff."""
+        try:
+            response = requests.head(
+                url,
+                headers=self.default_headers,
+                timeout=self.default_timeout,
+                allow_redirects=True,
+            )
+            length = response.headers.get("Content-Length")
+            return int(length) if response.ok and length else None
+        except Exception as e:
+            self.log.error(f"HEAD failed: {e}")
+            return None
+
+    def _get_request(self, url: str, headers: dict[str, str], stream: bool = False):
+        self.circuit_breaker.check()
         try:
             response = requests.get(
                 url,
                 headers={**self.default_headers, **headers},
                 timeout=self.default_timeout,
+                stream=stream,
             )
+            response.raise_for_status()
+            self.circuit_breaker.record_success()
             return response
         except Exception as e:
             self.log.error(f"Request failed: {e}")
+            if is_upstream_failure(e):
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.release()
             raise
@@ -0,0 +1,162 @@
+import gc
+import logging
+import os
+import threading
+import time
+from typing import Dict, Set, Tuple
+
+from src.python.logger import Logger
+
+
+class MemoryBudget:
+    """Keeps the loader under ``max_rss_mb`` of resident memory.
+
+    Csv rows are read in batches that shrink when RSS gets close to the
+    budget and grow back when there is room again. Workers call
+    ``wait_for_headroom`` before claiming a period, so a full process stops
+    downloading instead of being killed. A budget of 0 disables every check,
+    so does a platform without /proc to read the current RSS from.
+
+    CPython rarely gives freed memory back to the OS, RSS stays high after a
+    big period even though the next one reuses that memory. Claims are thus
+    admitted by estimate rather than by RSS: the largest growth seen over a
+    period times the periods loading, on top of the RSS the process started
+    with. Until a period has been measured they load one at a time.
+
+    RSS is per process, the peak reported for a period is the highest seen
+    while it was loading, other periods loading alongside included.
+    """
+
+    high_watermark = 0.85
+    low_watermark = 0.6
+    wait_timeout = 300.0
+
+    max_rss_mb: int
+    # RSS before any period was loaded
+    _baseline_mb: float
+    # Largest RSS growth seen over a period, 0 until one is measured
+    _estimate_mb: float
+    # (RSS at reset, peak RSS) per label being tracked
+    _peaks: Dict[str, Tuple[float, float]]
+    # Workers admitted by wait_for_headroom and not released yet
+    _admitted: Set[str]
+    _lock: threading.Lock
+    log: logging.Logger
+
+    def __init__(self, max_rss_mb: int, log4py: Logger) -> None:
+        self.log = log4py.getLogger("MemoryBudget")
+        self.max_rss_mb = max_rss_mb
+        self._estimate_mb = 0.0
+        self._peaks = {}
+        self._admitted = set()
+        self._lock = threading.Lock()
+        rss = self.rss_mb()
+        self._baseline_mb = rss or 0.0
+        if self.enabled and rss is None:
+            self.log.warning(
+                f"cannot read the current RSS, MAX_RSS_MB={max_rss_mb} is ignored"
+            )
+            self.max_rss_mb = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rss_mb > 0
+
+    @staticmethod
+    def rss_mb() -> float | None:
+        """Current RSS, None where /proc is not available."""
+        try:
+            with open("/proc/self/statm") as statm:
+                pages = int(statm.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def sample(self) -> float | None:
+        rss = self.rss_mb()
+        if rss is not None:
+            with self._lock:
+                for label, (start, peak) in self._peaks.items():
+                    self._peaks[label] = (start, max(peak, rss))
+        return rss
+
+    def usage(self) -> float:
+        """Fraction of the budget in use, 0 when the budget is disabled."""
+        if not self.enabled:
+            return 0.0
+        return (self.sample() or 0.0) / self.max_rss_mb
+
+    def next_batch_size(self, size: int, min_size: int, max_size: int) -> int:
+        if not self.enabled:
+            return size
+        usage = self.usage()
+        if usage > self.high_watermark:
+            return max(min_size, size // 2)
+        if usage < self.low_watermark:
+            return min(max_size, int(size * 1.5) + 1)
+        return size
+
+    def _has_room(self) -> bool:
+        if not self._admitted:
+            return True
+        if not self._estimate_mb:
+            return False
+        expected = self._baseline_mb + (len(self._admitted) + 1) * self._estimate_mb
+        return expected <= self.high_watermark * self.max_rss_mb
+
+    def wait_for_headroom(self, label: str):
+        """Blocks until one more period fits next to the ones loading.
+
+        ``label`` is admitted until ``release`` is called with it.
+        """
+        if not self.enabled:
+            return
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            with self._lock:
+                if self._has_room():
+                    self._admitted.add(label)
+                    return
+                if time.monotonic() > deadline:
+                    self.log.warning(
+                        f"[{label}] no room for another period in "
+                        f"{self.max_rss_mb}MB after {self.wait_timeout:.0f}s, "
+                        "going on"
+                    )
+                    self._admitted.add(label)
+                    return
+            if not waited:
+                self.log.info(f"[{label}] waiting for memory headroom")
+                waited = True
+            gc.collect()
+            time.sleep(0.5)
+
+    def release(self, label: str):
+        with self._lock:
+            self._admitted.discard(label)
+
+    def reset_peak(self, label: str):
+        """Starts tracking the peak RSS of ``label`` from the current RSS."""
+        rss = self.rss_mb()
+        if rss is not None:
+            with self._lock:
+                self._peaks[label] = (rss, rss)
+
+    def report(self, label: str):
+        """Logs the peak RSS of ``label`` since its reset against the budget,
+        its growth is the estimate of the next periods."""
+        self.sample()
+        with self._lock:
+            tracked = self._peaks.pop(label, None)
+            if tracked is None:
+                return
+            start, peak = tracked
+            self._estimate_mb = max(self._estimate_mb, peak - start)
+        if self.enabled:
+            self.log.info(
+                f"[{label}] peak_rss={peak:.0f}MB budget={self.max_rss_mb}MB "
+                f"used={peak / self.max_rss_mb:.0%}"
+            )
+        else:
+            self.log.info(f"[{label}] peak_rss={peak:.0f}MB")
@@ -0,0 +1,178 @@
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from operator import itemgetter
+from typing import Iterable, List
+
+import psycopg
+from psycopg import ClientCursor
+from pydantic.dataclasses import dataclass
+from tqdm import tqdm
+
+from src.python.logger import Logger
+from src.python.pipeline import PubOfficer
+from src.python.postgres import NominaPgPool
+
+# (codigo_persona, entidad_key, codigo_objecto_gasto, monto_devengado)
+OfficerKey = tuple[str, str | None, str | None, int | None]
+
+
+@dataclass(frozen=True)
+class EmploymentOverlap:
+    anio: int
+    mes: int
+    codigo_persona: str
+    overlap_type: str
+    num_items: int
+    items: List[str]
+    monto_devengado: int
+
+
+def officer_keys(pub_officers: Iterable[PubOfficer]) -> List[OfficerKey]:
+    return [
+        (
+            p.codigo_persona,
+            p.entidad_key,
+            None if p.codigo_objecto_gasto is None else str(p.codigo_objecto_gasto),
+            p.monto_devengado,
+        )
+        for p in pub_officers
+    ]
+
+
+def detect_overlaps(
+    anio: int, mes: int, keys: Iterable[OfficerKey], presorted: bool = False
+) -> List[EmploymentOverlap]:
+    """Finds people paid by several entidades or objetos de gasto in a period.
+
+    The rows are sorted by ``codigo_persona`` (unless ``presorted``) and
+    grouped, so the cost is one sort of the period instead of a self join.
+    """
+    if not presorted:
+        keys = sorted(keys, key=itemgetter(0))
+    overlaps: List[EmploymentOverlap] = []
+    for codigo_persona, group in itertools.groupby(keys, key=itemgetter(0)):
+        rows = list(group)
+        if len(rows) < 2:
+            continue
+        entidades = sorted({r[1] for r in rows if r[1] is not None})
+        objetos = sorted({r[2] for r in rows if r[2] is not None})
+        monto = sum(r[3] or 0 for r in rows)
+        for overlap_type, items in (("ENTIDAD", entidades), ("OBJETO_GASTO", objetos)):
+            if len(items) < 2:
+                continue
+            overlaps.append(
+                EmploymentOverlap(
+                    anio=anio,
+                    mes=mes,
+                    codigo_persona=codigo_persona,
+                    overlap_type=overlap_type,
+                    num_items=len(items),
+                    items=items,
+                    monto_devengado=monto,
+                )
+            )
+    return overlaps
+
+
+class OverlapDetector:
+    """Stores the multi entity employment findings of every period."""
+
+    log: logging.Logger
+
+    def __init__(self, log4py: Logger) -> None:
+        self.log = log4py.getLogger("OverlapDetector")
+
+    def save(
+        self, cur: ClientCursor, anio: int, mes: int, overlaps: List[EmploymentOverlap]
+    ):
+        clean_current_month = """
+        DELETE FROM pynomina.hacienda_pub_officers_overlaps WHERE anio = %(anio)s AND mes = %(mes)s
+        """
+        insert_overlap = """
+        INSERT INTO pynomina.hacienda_pub_officers_overlaps (
+            anio,
+            mes,
+            codigo_persona,
+            overlap_type,
+            num_items,
+            items,
+            monto_devengado
+        )
+        VALUES (
+            %(anio)s, %(mes)s, %(codigo_persona)s, %(overlap_type)s::public.overlap_type,
+            %(num_items)s, %(items)s, %(monto_devengado)s
+        )
+        """
+        cur.execute(clean_current_month, {"anio": anio, "mes": mes})
+        cur.executemany(insert_overlap, [asdict(o) for o in overlaps])
+        self.log.info(f"[{anio}-{mes:02}] found {len(overlaps)} overlaps")
+
+    def publish(
+        self, cur: ClientCursor, anio_mes: str, pub_officers: Iterable[PubOfficer]
+    ) -> List[EmploymentOverlap]:
+        anio, mes = (int(p) for p in anio_mes.split("-"))
+        overlaps = detect_overlaps(anio, mes, officer_keys(pub_officers))
+        self.save(cur, anio, mes, overlaps)
+        return overlaps
+
+    def _backfill_period(self, pgpool_mgr: NominaPgPool, anio: int, mes: int):
+        query = """
+        SELECT
+            codigo_persona,
+            entidad_key,
+            codigo_objecto_gasto,
+            monto_devengado
+        FROM
+            pynomina.hacienda_pub_officers_v
+        WHERE
+            anio = %(anio)s AND mes = %(mes)s
+        ORDER BY
+            codigo_persona
+        """
+        with pgpool_mgr.get_conn() as conn, psycopg.ClientCursor(conn) as cur:
+            with conn.cursor(name=f"overlaps_{anio}_{mes}") as rows_cur:
+                rows_cur.itersize = 10000
+                keys = (
+                    (
+                        r["codigo_persona"],
+                        r["entidad_key"],
+                        r["codigo_objecto_gasto"],
+                        r["monto_devengado"],
+                    )
+                    for r in rows_cur.execute(query, {"anio": anio, "mes": mes})
+                )
+                overlaps = detect_overlaps(anio, mes, keys, presorted=True)
+            self.save(cur, anio, mes, overlaps)
+
+    def backfill(
+        self,
+        pgpool_mgr: NominaPgPool,
+        workers: int,
+        periods: List[tuple[int, int]] | None = None,
+    ):
+        """Recomputes the findings of already loaded periods in parallel."""
+        if not periods:
+            query = """
+            SELECT DISTINCT
+                anio,
+                mes
+            FROM
+                pynomina.hacienda_pub_officers
+            ORDER BY
+                anio, mes
+            """
+            with pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+                periods = [(r["anio"], r["mes"]) for r in cur.execute(query)]
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [
+                executor.submit(self._backfill_period, pgpool_mgr, anio, mes)
+                for anio, mes in periods
+            ]
+            for future in tqdm(futures, desc="Backfilling overlaps", unit="period"):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.log.error(e)
@@ -0,0 +1,230 @@
+import logging
+from typing import IO, List, Set
+
+import pydantic
+from psycopg.rows import dict_row
+from psycopg.sql import SQL, Literal
+from pydantic.dataclasses import dataclass
+
+from src.python.config import Config, NominasConf
+from src.python.httpclient import CircuitBreaker, HttpClient
+from src.python.logger import Logger
+from src.python.postgres import NominaPgPool
+
+
+@dataclass
+class AvailableData:
+    dataset: str
+    periodo: str
+    fechaCreacion: str
+    resource_url: str
+
+
+@dataclass
+class PlanItem:
+    periodo: str
+    reason: str  # PENDING: never loaded, CHANGED: republished since loaded
+    resource_url: str
+    expected_bytes: int | None
+    estimated_seconds: float | None
+
+
+class PeriodIndex:
+    """The periods published by the index against what postgres holds of them.
+
+    Only the index, the download history and the work queue are read, so
+    ``plan`` runs without importing or setting up the loader.
+    """
+
+    nominas_conf: NominasConf
+    pgpool_mgr: NominaPgPool
+    client: HttpClient
+    loader_concurrency: int
+    log4py: Logger
+    log: logging.Logger
+
+    def __init__(self, log4py: Logger, config: Config) -> None:
+        self.log4py = log4py
+        self.log = log4py.getLogger("PeriodIndex")
+        self.client = HttpClient(
+            default_headers={
+                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36 Edg/132.0.0.0"
+            },
+            default_timeout=5,
+            max_tries=config.nominas.max_tries,
+            log4py=log4py,
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=config.nominas.circuit_failures,
+                cooldown_seconds=config.nominas.circuit_cooldown_seconds,
+                log4py=log4py,
+            ),
+        )
+        self.pgpool_mgr = NominaPgPool(conf=config.pg, log4py=log4py)
+        self.nominas_conf = config.nominas
+        self.loader_concurrency = config.pg.loader_concurrency
+
+    def get_histories(self):
+        query = """
+        SELECT
+        	h.resource_url
+        FROM
+        	public.download_history h
+        WHERE
+        	h.stat = 'SUCCEED'::public.download_stat
+        GROUP BY
+        	resource_url
+        """
+        with self.pgpool_mgr.get_conn() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                rs = cur.execute(query).fetchall()
+                return [str(r["resource_url"]) for r in rs]
+
+    def get_backing_off(self) -> Set[str]:
+        """Resources whose last attempt failed and are not due for a retry."""
+        query = """
+        SELECT
+        	l.resource_url
+        FROM (
+        	SELECT DISTINCT ON (h.resource_url)
+        		h.resource_url,
+        		h.stat,
+        		h.next_eligible_at_utc
+        	FROM
+        		public.download_history h
+        	ORDER BY
+        		h.resource_url, h.download_at_utc DESC
+        ) l
+        WHERE
+        	l.stat = 'FAILED'::public.download_stat
+        	AND l.next_eligible_at_utc > (NOW() AT TIME ZONE 'utc')
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            return {str(r["resource_url"]) for r in cur.execute(query)}
+
+    def _resource_url(self, periodo: str) -> str:
+        return f"{self.nominas_conf.resource}/nomina_{periodo}.zip"
+
+    def get_available_data(self) -> List[AvailableData]:
+        resp = self.client.get(self.nominas_conf.resource).json()
+        try:
+            return [
+                AvailableData(
+                    **(r | {"resource_url": self._resource_url(r["periodo"])})
+                )
+                for r in resp
+            ]
+        except pydantic.ValidationError as e:
+            self.log.error(f"Error upon parsing: {resp}")
+            raise e
+
+    def get_changed(self, available_data: List[AvailableData]) -> List[str]:
+        """Periods whose fechaCreacion in the index differs from the one loaded.
+
+        The queue keeps the fechaCreacion of the last successful load, so a
+        republished period whose reload failed is still reported.
+        """
+        query = """
+        SELECT
+            q.periodo,
+            q.fecha_creacion
+        FROM
+            public.download_queue q
+        WHERE
+            q.stat IN ('DONE'::public.queue_stat, 'FAILED'::public.queue_stat)
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            loaded = {r["periodo"]: r["fecha_creacion"] for r in cur.execute(query)}
+        return [
+            ad.periodo
+            for ad in available_data
+            if ad.periodo in loaded and loaded[ad.periodo] != ad.fechaCreacion
+        ]
+
+    def get_load_metrics(self) -> dict[str, float]:
+        """Averages of the last successful loads, used to estimate a plan."""
+        query = """
+        SELECT
+            AVG(h.size_bytes)::FLOAT8 AS avg_bytes,
+            AVG(h.elapsed_ms)::FLOAT8 AS avg_ms,
+            (SUM(h.elapsed_ms) / NULLIF(SUM(h.size_bytes), 0))::FLOAT8 AS ms_per_byte
+        FROM (
+            SELECT
+                size_bytes,
+                elapsed_ms
+            FROM
+                public.download_history
+            WHERE
+                stat = 'SUCCEED'::public.download_stat
+                AND elapsed_ms IS NOT NULL
+            ORDER BY
+                download_at_utc DESC
+            LIMIT 12
+        ) h
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            row = cur.execute(query).fetchone()
+        return {k: v for k, v in (row or {}).items() if v is not None}
+
+    def plan(self, with_sizes: bool = False) -> List[PlanItem]:
+        """Lists what a sync would load, without downloading any archive.
+
+        ``with_sizes`` asks the server for the size of every archive (one
+        HEAD request each), otherwise sizes come from previous loads.
+        """
+        available_data = self.get_available_data()
+        downloaded = self.get_histories()
+        backing_off = self.get_backing_off()
+        changed = set(self.get_changed(available_data))
+        metrics = self.get_load_metrics()
+        items: List[PlanItem] = []
+        for ad in available_data:
+            if ad.resource_url in backing_off:
+                continue
+            elif ad.resource_url not in downloaded:
+                reason = "PENDING"
+            elif ad.periodo in changed:
+                reason = "CHANGED"
+            else:
+                continue
+            expected_bytes = None
+            if with_sizes:
+                expected_bytes = self.client.content_length(ad.resource_url)
+            if expected_bytes is None and "avg_bytes" in metrics:
+                expected_bytes = int(metrics["avg_bytes"])
+            estimated_seconds = None
+            if expected_bytes is not None and "ms_per_byte" in metrics:
+                estimated_seconds = expected_bytes * metrics["ms_per_byte"] / 1000
+            elif "avg_ms" in metrics:
+                estimated_seconds = metrics["avg_ms"] / 1000
+            items.append(
+                PlanItem(
+                    periodo=ad.periodo,
+                    reason=reason,
+                    resource_url=ad.resource_url,
+                    expected_bytes=expected_bytes,
+                    estimated_seconds=estimated_seconds,
+                )
+            )
+        return items
+
+    def teardown(self):
+        self.pgpool_mgr.teardown()
+
+
+def export_period(pgpool_mgr: NominaPgPool, periodo: str, output: IO[bytes]):
+    """Writes the stored rows of a period as CSV."""
+    anio, mes = (int(p) for p in periodo.split("-"))
+    query = SQL("""
+        COPY (
+            SELECT * FROM pynomina.hacienda_pub_officers_v
+            WHERE anio = {anio} AND mes = {mes}
+            ORDER BY codigo_evento, orden
+        ) TO STDOUT WITH (FORMAT CSV, HEADER)
+        """).format(anio=Literal(anio), mes=Literal(mes))
+    with (
+        pgpool_mgr.get_conn() as conn,
+        conn.cursor() as cur,
+        cur.copy(query) as copy,
+    ):
+        for data in copy:
+            output.write(data)
@@ -1,25 +1,37 @@
 import functools
+import itertools
+import json
 import logging
 import multiprocessing
+import os
+import pathlib
+import unicodedata
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
 from datetime import datetime
 from datetime import datetime as dt
-from typing import List, Set
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 from psycopg import ClientCursor
 from pydantic.dataclasses import dataclass
 from tqdm import tqdm
 
 from src.python.logger import Logger
+from src.python.memory import MemoryBudget
+from src.python.surrogates import DimensionKeyCache
 
-
-@dataclass
-class AvailableData:
-    dataset: str
-    periodo: str
-    fechaCreacion: str
-    resource_url: str
+T = TypeVar("T")
 
 
 @dataclass
@@ -73,6 +85,7 @@ class Persona:
     apellidos: str
     fecha_nacimiento: datetime | None
     sexo: str
+    nombre_busqueda: str
 
 
 @dataclass(frozen=True)
@@ -164,7 +177,90 @@ class ProcessedCsvItems:
     pub_officers: Set[PubOfficer]
 
 
-def parse_raw_item(raw: RawCsvItem, log: logging.Logger):
+def normalize_name(name: str) -> str:
+    """Lowercases, strips accents and collapses whitespace, like unaccent."""
+    decomposed = unicodedata.normalize("NFKD", name.lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.split())
+
+
+class DimensionCatalog:
+    """Canonical dimension rows shared by every period parsed in a run.
+
+    Rows are looked up by their raw CSV fields, so a dimension seen in an
+    earlier period is reused as is instead of being stripped and built again.
+    The catalog can be saved to disk and loaded by the next run.
+    """
+
+    _types: Dict[str, Any] = {
+        "nivel": Nivel,
+        "entidad": Entidad,
+        "programa": Programa,
+        "proyecto": Proyecto,
+        "unidad": UnidadResponsable,
+        "objecto_gasto": ObjectoGasto,
+    }
+
+    # dimension -> raw csv fields -> canonical row
+    _entries: Dict[str, Dict[Tuple[str, ...], Any]]
+    _loaded: int
+
+    def __init__(self) -> None:
+        self._entries = {dimension: {} for dimension in self._types}
+        self._loaded = 0
+
+    def get(
+        self, dimension: str, raw_key: Tuple[str, ...], build: Callable[[], T]
+    ) -> T:
+        entries = self._entries[dimension]
+        found = entries.get(raw_key)
+        if found is None:
+            # Concurrent parsers may build the same row, only one is kept
+            found = entries.setdefault(raw_key, build())
+        return found
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    @property
+    def dirty(self) -> bool:
+        return len(self) != self._loaded
+
+    def sizes(self) -> Dict[str, int]:
+        return {dimension: len(entries) for dimension, entries in self._entries.items()}
+
+    def save(self, path: str):
+        snapshot = {
+            dimension: [[list(k), asdict(v)] for k, v in entries.items()]
+            for dimension, entries in self._entries.items()
+        }
+        target = pathlib.Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_text(json.dumps(snapshot, ensure_ascii=False))
+        os.replace(tmp, target)
+        self._loaded = len(self)
+
+    @classmethod
+    def load(cls, path: str, log: logging.Logger) -> "DimensionCatalog":
+        """Reads a saved catalog, a missing or unreadable file gives an empty one."""
+        catalog = cls()
+        try:
+            snapshot = json.loads(pathlib.Path(path).read_text())
+            for dimension, entries in snapshot.items():
+                build = cls._types[dimension]
+                catalog._entries[dimension] = {tuple(k): build(**v) for k, v in entries}
+        except FileNotFoundError:
+            return catalog
+        except Exception as e:
+            log.warning(f"ignoring dimension catalog {path}: {e}")
+            return cls()
+        catalog._loaded = len(catalog)
+        log.info(f"dimension catalog loaded: {catalog.sizes()}")
+        return catalog
+
+
+def parse_raw_item(raw: RawCsvItem, log: logging.Logger, catalog: DimensionCatalog):
     """Parses a single RawCsvItem into processed entities."""
     try:
         codigo_evento = f"{raw.anio}{str(raw.mes).zfill(2)}-{raw.codigoPersona}"
@@ -180,43 +276,79 @@ def parse_raw_item(raw: RawCsvItem, log: logging.Logger):
             apellidos=raw.apellidos.strip(),
             fecha_nacimiento=None,
             sexo=sexo,
+            nombre_busqueda=normalize_name(f"{raw.nombres} {raw.apellidos}"),
+        )
+        nivel = catalog.get(
+            "nivel",
+            (raw.codigoNivel, raw.nivelAbr, raw.descripcionNivel),
+            lambda: Nivel(
+                nivel_key=f"{raw.codigoNivel.strip()}-{raw.nivelAbr.strip()}",
+                codigo_nivel=raw.codigoNivel.strip(),
+                nivel_abr=raw.nivelAbr.strip(),
+                desc_nivel=raw.descripcionNivel.strip(),
+            ),
+        )
+        entidad = catalog.get(
+            "entidad",
+            (raw.codigoEntidad, raw.entidadAbr, raw.descripcionEntidad),
+            lambda: Entidad(
+                entidad_key=f"{raw.codigoEntidad.strip()}-{raw.entidadAbr.strip()}",
+                codigo_entidad=raw.codigoEntidad.strip(),
+                entidad_abr=raw.entidadAbr.strip(),
+                desc_entidad=raw.descripcionEntidad.strip(),
+            ),
         )
-        nivel = Nivel(
-            nivel_key=f"{raw.codigoNivel.strip()}-{raw.nivelAbr.strip()}",
-            codigo_nivel=raw.codigoNivel.strip(),
-            nivel_abr=raw.nivelAbr.strip(),
-            desc_nivel=raw.descripcionNivel.strip(),
-        )
-        entidad = Entidad(
-            entidad_key=f"{raw.codigoEntidad.strip()}-{raw.entidadAbr.strip()}",
-            codigo_entidad=raw.codigoEntidad.strip(),
-            entidad_abr=raw.entidadAbr.strip(),
-            desc_entidad=raw.descripcionEntidad.strip(),
-        )
-        programa = Programa(
-            programa_key=f"{raw.codigoPrograma.strip()}-{raw.codigoSubprograma.strip()}-{raw.programaAbr.strip()}-{raw.subprogramaAbr.strip()}",
-            codigo_programa=raw.codigoPrograma.strip(),
-            codigo_sub_programa=raw.codigoSubprograma.strip(),
-            programa_abr=raw.programaAbr.strip(),
-            sub_programa_abr=raw.subprogramaAbr.strip(),
-            desc_programa=raw.descripcionPrograma.strip(),
-            desc_sub_programa=raw.descripcionSubprograma.strip(),
-        )
-        proyecto = Proyecto(
-            proyecto_key=f"{raw.codigoProyecto.strip()}-{raw.proyectoAbr.strip()}",
-            codigo_proyecto=raw.codigoProyecto.strip(),
-            proyecto_abr=raw.proyectoAbr.strip(),
-            desc_proyecto=raw.descripcionProyecto.strip(),
-        )
-        unidad = UnidadResponsable(
-            unidad_responsable_key=f"{raw.codigoUnidadResponsable.strip()}-{raw.unidadAbr.strip()}",
-            codigo_unidad_responsable=raw.codigoUnidadResponsable.strip(),
-            unidad_responsable_abr=raw.unidadAbr.strip(),
-            desc_unidad_responsable=raw.descripcionUnidadResponsable.strip(),
-        )
-        objecto_gasto = ObjectoGasto(
-            codigo_objecto_gasto=raw.codigoObjetoGasto.strip(),
-            concepto_gasto=raw.conceptoGasto.strip(),
+        programa = catalog.get(
+            "programa",
+            (
+                raw.codigoPrograma,
+                raw.codigoSubprograma,
+                raw.programaAbr,
+                raw.subprogramaAbr,
+                raw.descripcionPrograma,
+                raw.descripcionSubprograma,
+            ),
+            lambda: Programa(
+                programa_key=f"{raw.codigoPrograma.strip()}-{raw.codigoSubprograma.strip()}-{raw.programaAbr.strip()}-{raw.subprogramaAbr.strip()}",
+                codigo_programa=raw.codigoPrograma.strip(),
+                codigo_sub_programa=raw.codigoSubprograma.strip(),
+                programa_abr=raw.programaAbr.strip(),
+                sub_programa_abr=raw.subprogramaAbr.strip(),
+                desc_programa=raw.descripcionPrograma.strip(),
+                desc_sub_programa=raw.descripcionSubprograma.strip(),
+            ),
+        )
+        proyecto = catalog.get(
+            "proyecto",
+            (raw.codigoProyecto, raw.proyectoAbr, raw.descripcionProyecto),
+            lambda: Proyecto(
+                proyecto_key=f"{raw.codigoProyecto.strip()}-{raw.proyectoAbr.strip()}",
+                codigo_proyecto=raw.codigoProyecto.strip(),
+                proyecto_abr=raw.proyectoAbr.strip(),
+                desc_proyecto=raw.descripcionProyecto.strip(),
+            ),
+        )
+        unidad = catalog.get(
+            "unidad",
+            (
+                raw.codigoUnidadResponsable,
+                raw.unidadAbr,
+                raw.descripcionUnidadResponsable,
+            ),
+            lambda: UnidadResponsable(
+                unidad_responsable_key=f"{raw.codigoUnidadResponsable.strip()}-{raw.unidadAbr.strip()}",
+                codigo_unidad_responsable=raw.codigoUnidadResponsable.strip(),
+                unidad_responsable_abr=raw.unidadAbr.strip(),
+                desc_unidad_responsable=raw.descripcionUnidadResponsable.strip(),
+            ),
+        )
+        objecto_gasto = catalog.get(
+            "objecto_gasto",
+            (raw.codigoObjetoGasto, raw.conceptoGasto),
+            lambda: ObjectoGasto(
+                codigo_objecto_gasto=raw.codigoObjetoGasto.strip(),
+                concepto_gasto=raw.conceptoGasto.strip(),
+            ),
         )
 
         fecha_ingreso = None
@@ -233,12 +365,12 @@ def parse_raw_item(raw: RawCsvItem, log: logging.Logger):
             mes=int(raw.mes),
             codigo_persona=raw.codigoPersona.strip(),
             discapacidad=True if raw.discapacidad == "Y" else False,
-            nivel_key=f"{raw.codigoNivel.strip()}-{raw.nivelAbr.strip()}",
-            entidad_key=f"{raw.codigoEntidad.strip()}-{raw.entidadAbr.strip()}",
-            programa_key=f"{raw.codigoPrograma.strip()}-{raw.codigoSubprograma.strip()}-{raw.programaAbr.strip()}-{raw.subprogramaAbr.strip()}",
-            proyecto_key=f"{raw.codigoProyecto.strip()}-{raw.proyectoAbr.strip()}",
-            unidad_responsable_key=f"{raw.codigoUnidadResponsable.strip()}-{raw.unidadAbr.strip()}",
-            codigo_objecto_gasto=int(raw.codigoObjetoGasto.strip()),
+            nivel_key=nivel.nivel_key,
+            entidad_key=entidad.entidad_key,
+            programa_key=programa.programa_key,
+            proyecto_key=proyecto.proyecto_key,
+            unidad_responsable_key=unidad.unidad_responsable_key,
+            codigo_objecto_gasto=int(objecto_gasto.codigo_objecto_gasto),
             fuente_financiamiento=raw.fuenteFinanciamiento.strip(),
             linea=raw.linea.strip(),
             codigo_categoria=raw.codigoCategoria.strip(),
@@ -272,83 +404,231 @@ def parse_raw_item(raw: RawCsvItem, log: logging.Logger):
 
 
 class NominaPipeline:
+    # Rows per insert batch, resized between batches by the memory budget
+    batch_size = 10000
+    min_batch_size = 1000
+    max_batch_size = 100000
 
     _parsed_data: ProcessedCsvItems
+    _budget: MemoryBudget
     anio_mes: str
+    # Rows read from the csv, the rows in the batches unless the loader sets
+    # it with the rows the csv handler rejected, see verification.py
+    rows_read: int
+    _parsed: int
     log: logging.Logger
 
     def __init__(
         self,
-        data: List[RawCsvItem],
+        batches: Iterable[Sequence[RawCsvItem]],
         anio_mes: str,
         log4py: Logger,
+        budget: MemoryBudget | None = None,
+        catalog: DimensionCatalog | None = None,
     ) -> None:
         self.log = log4py.getLogger("NominaPipeline")
         self.anio_mes = anio_mes
+        self._budget = budget or MemoryBudget(max_rss_mb=0, log4py=log4py)
         num_workers = multiprocessing.cpu_count()  # Use all CPU cores
-        parse_with_log = functools.partial(parse_raw_item, log=self.log)
-
-        # Use tqdm for progress tracking
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            results = list(
-                tqdm(
-                    executor.map(parse_with_log, data),  # No chunksize needed
-                    total=len(data),
-                    desc=f"[{anio_mes}] Processing records",
-                    unit="item",
-                )
-            )
+        parse_with_log = functools.partial(
+            parse_raw_item,
+            log=self.log,
+            catalog=catalog if catalog is not None else DimensionCatalog(),
+        )
 
-        # Remove None values (in case of errors)
-        results = [r for r in results if r is not None]
-
-        # Unpack parsed entities into separate sets
-        (
-            personas,
-            niveles,
-            entidades,
-            programas,
-            proyectos,
-            unidades,
-            objecto_gastos,
-            pub_officers,
-        ) = zip(*results)
+        personas: Set[Persona] = set()
+        niveles: Set[Nivel] = set()
+        entidades: Set[Entidad] = set()
+        programas: Set[Programa] = set()
+        proyectos: Set[Proyecto] = set()
+        unidades: Set[UnidadResponsable] = set()
+        objecto_gastos: Set[ObjectoGasto] = set()
+        pub_officers: Set[PubOfficer] = set()
+        read = 0
+        parsed = 0
+
+        # Parse batch by batch as they are read, so neither the raw rows nor
+        # the intermediate tuples of more than one batch are alive
+        with (
+            ThreadPoolExecutor(max_workers=num_workers) as executor,
+            tqdm(desc=f"[{anio_mes}] Processing records", unit="item") as pbar,
+        ):
+            for batch in batches:
+                read += len(batch)
+                for result in executor.map(parse_with_log, batch):
+                    # Skip None values (in case of errors)
+                    if result is None:
+                        continue
+                    parsed += 1
+                    personas.add(result[0])
+                    niveles.add(result[1])
+                    entidades.add(result[2])
+                    programas.add(result[3])
+                    proyectos.add(result[4])
+                    unidades.add(result[5])
+                    objecto_gastos.add(result[6])
+                    pub_officers.add(result[7])
+                pbar.update(len(batch))
 
         self._parsed_data = ProcessedCsvItems(
-            personas=set(personas),
-            niveles=set(niveles),
-            entidades=set(entidades),
-            programas=set(programas),
-            proyectos=set(proyectos),
-            unidades=set(unidades),
-            objecto_gastos=set(objecto_gastos),
-            pub_officers=set(pub_officers),
+            personas=personas,
+            niveles=niveles,
+            entidades=entidades,
+            programas=programas,
+            proyectos=proyectos,
+            unidades=unidades,
+            objecto_gastos=objecto_gastos,
+            pub_officers=pub_officers,
         )
+        self.rows_read = read
+        self._parsed = parsed
+
+        self.log.info(f"Finished processing {read} records.")
+
+    @property
+    def rows_rejected(self) -> int:
+        """Rows rejected by the csv handler or the parser."""
+        return self.rows_read - self._parsed
+
+    @property
+    def rows_duplicated(self) -> int:
+        """Valid rows collapsed into an identical one."""
+        return self._parsed - len(self._parsed_data.pub_officers)
+
+    def _in_batches(self, items: Iterable[T]) -> Iterator[List[T]]:
+        iterator = iter(items)
+        while batch := list(itertools.islice(iterator, self.batch_size)):
+            yield batch
+            self.batch_size = self._budget.next_batch_size(
+                self.batch_size, self.min_batch_size, self.max_batch_size
+            )
 
-        self.log.info(f"Finished processing {len(data)} records.")
-
-    def persist_to_pg(self, cur: ClientCursor):
+    @property
+    def pub_officers(self) -> Set[PubOfficer]:
+        return self._parsed_data.pub_officers
+
+    def resolve_keys(self, key_cache: DimensionKeyCache):
+        """Upserts the period dimensions through key_cache, which commits them
+        on its own connection, call it before taking the one to persist with."""
+        key_cache.resolve("nivel", self._parsed_data.niveles)
+        key_cache.resolve("entidad", self._parsed_data.entidades)
+        key_cache.resolve("programa", self._parsed_data.programas)
+        key_cache.resolve("proyecto", self._parsed_data.proyectos)
+        key_cache.resolve("unidad", self._parsed_data.unidades)
+
+    def persist_to_pg(
+        self, cur: ClientCursor, key_cache: DimensionKeyCache | None = None
+    ):
+        """Saves the period, with integer dimension keys if key_cache is given,
+        once resolve_keys has run with it."""
         insert_persona = """
         INSERT INTO public.py_personas (
             codigo_persona,
             nombres,
             apellidos,
             fecha_nacimiento,
-            sexo
+            sexo,
+            nombre_busqueda,
+            search_tsv
         )
         VALUES (
             %(codigo_persona)s, %(nombres)s, %(apellidos)s,
-            %(fecha_nacimiento)s, %(sexo)s::public.gender
+            %(fecha_nacimiento)s, %(sexo)s::public.gender,
+            %(nombre_busqueda)s, TO_TSVECTOR('simple', %(nombre_busqueda)s)
         )
         ON CONFLICT (codigo_persona)
         DO UPDATE SET
             nombres = EXCLUDED.nombres,
             apellidos = EXCLUDED.apellidos,
             fecha_nacimiento = EXCLUDED.fecha_nacimiento,
-            sexo = EXCLUDED.sexo
+            sexo = EXCLUDED.sexo,
+            nombre_busqueda = EXCLUDED.nombre_busqueda,
+            search_tsv = EXCLUDED.search_tsv
+        """
+        for batch in self._in_batches(self._parsed_data.personas):
+            cur.executemany(insert_persona, [asdict(p) for p in batch])
+
+        if key_cache is None:
+            self._upsert_dimensions(cur)
+
+        insert_objecto_gasto = """
+        INSERT INTO pynomina.hacienda_pub_officers_objecto_gasto (
+            codigo_objecto_gasto,
+            concepto_gasto
+        )
+        VALUES (
+            %(codigo_objecto_gasto)s, %(concepto_gasto)s
+        )
+        ON CONFLICT (codigo_objecto_gasto)
+        DO UPDATE SET
+            concepto_gasto = EXCLUDED.concepto_gasto
         """
-        cur.executemany(insert_persona, [asdict(p) for p in self._parsed_data.personas])
+        cur.executemany(
+            insert_objecto_gasto, [asdict(o) for o in self._parsed_data.objecto_gastos]
+        )
 
+        clean_current_month = """
+        DELETE FROM pynomina.hacienda_pub_officers WHERE anio = %(anio)s AND mes = %(mes)s
+        """
+        insert_pub_officer = """
+        INSERT INTO pynomina.hacienda_pub_officers (
+            codigo_evento,
+            orden,
+            anio,
+            mes,
+            codigo_persona,
+            discapacidad,
+            nivel_key,
+            entidad_key,
+            programa_key,
+            proyecto_key,
+            unidad_responsable_key,
+            nivel_id,
+            entidad_id,
+            programa_id,
+            proyecto_id,
+            unidad_responsable_id,
+            codigo_objecto_gasto,
+            fuente_financiamiento,
+            linea,
+            codigo_categoria,
+            cargo,
+            horas_catedra,
+            fecha_ingreso,
+            tipo_personal,
+            lugar,
+            monto_presupuestado,
+            monto_devengado,
+            anio_corte,
+            mes_corte,
+            fecha_corte
+        )
+        SELECT
+            %(codigo_evento)s,
+            COALESCE(MAX(orden) + 1, 1),
+            %(anio)s, %(mes)s, %(codigo_persona)s, %(discapacidad)s,
+            %(nivel_key)s, %(entidad_key)s, %(programa_key)s, %(proyecto_key)s,
+            %(unidad_responsable_key)s, %(nivel_id)s, %(entidad_id)s, %(programa_id)s,
+            %(proyecto_id)s, %(unidad_responsable_id)s, %(codigo_objecto_gasto)s, %(fuente_financiamiento)s, %(linea)s,
+            %(codigo_categoria)s, %(cargo)s, %(horas_catedra)s, %(fecha_ingreso)s,
+            %(tipo_personal)s, %(lugar)s, %(monto_presupuestado)s, %(monto_devengado)s,
+            %(anio_corte)s, %(mes_corte)s, %(fecha_corte)s
+        FROM
+            pynomina.hacienda_pub_officers
+        WHERE
+            codigo_evento = %(codigo_evento)s
+        """
+        for p in self._parsed_data.pub_officers:
+            # query = cur.mogrify(insert_pub_officer, asdict(p))
+            # print(query)
+            cur.execute(clean_current_month, {"anio": p.anio, "mes": p.mes})
+            break
+        for batch in self._in_batches(self._parsed_data.pub_officers):
+            cur.executemany(
+                insert_pub_officer, [self._fact_row(p, key_cache) for p in batch]
+            )
+
+    def _upsert_dimensions(self, cur: ClientCursor):
         insert_nivels = """
         INSERT INTO pynomina.hacienda_pub_officers_niveles (
             nivel_key,
@@ -460,72 +740,62 @@ class NominaPipeline:
             insert_unidad_resp, [asdict(u) for u in self._parsed_data.unidades]
         )
 
-        insert_objecto_gasto = """
-        INSERT INTO pynomina.hacienda_pub_officers_objecto_gasto (
-            codigo_objecto_gasto,
-            concepto_gasto
-        )
-        VALUES (
-            %(codigo_objecto_gasto)s, %(concepto_gasto)s
-        )
-        ON CONFLICT (codigo_objecto_gasto)
-        DO UPDATE SET
-            concepto_gasto = EXCLUDED.concepto_gasto
-        """
-        cur.executemany(
-            insert_objecto_gasto, [asdict(o) for o in self._parsed_data.objecto_gastos]
-        )
-
+    def _fact_row(
+        self, p: PubOfficer, key_cache: DimensionKeyCache | None
+    ) -> Dict[str, Any]:
+        if key_cache is None:
+            return asdict(p) | {
+                "nivel_id": None,
+                "entidad_id": None,
+                "programa_id": None,
+                "proyecto_id": None,
+                "unidad_responsable_id": None,
+            }
+        return asdict(p) | {
+            "nivel_key": None,
+            "entidad_key": None,
+            "programa_key": None,
+            "proyecto_key": None,
+            "unidad_responsable_key": None,
+            "nivel_id": key_cache.get("nivel", p.nivel_key),
+            "entidad_id": key_cache.get("entidad", p.entidad_key),
+            "programa_id": key_cache.get("programa", p.programa_key),
+            "proyecto_id": key_cache.get("proyecto", p.proyecto_key),
+            "unidad_responsable_id": key_cache.get("unidad", p.unidad_responsable_key),
+        }
+
+    def refresh_person_timeline(self, cur: ClientCursor):
+        """Rebuilds the compact per-person history for the loaded period."""
+        anio, mes = (int(p) for p in self.anio_mes.split("-"))
         clean_current_month = """
-        DELETE FROM pynomina.hacienda_pub_officers WHERE anio = %(anio)s AND mes = %(mes)s
+        DELETE FROM pynomina.hacienda_pub_officers_timeline WHERE anio = %(anio)s AND mes = %(mes)s
         """
-        insert_pub_officer = """
-        INSERT INTO pynomina.hacienda_pub_officers (
-            codigo_evento,
-            orden,
+        insert_timeline = """
+        INSERT INTO pynomina.hacienda_pub_officers_timeline (
+            codigo_persona,
             anio,
             mes,
-            codigo_persona,
-            discapacidad,
-            nivel_key,
-            entidad_key,
-            programa_key,
-            proyecto_key,
-            unidad_responsable_key,
-            codigo_objecto_gasto,
-            fuente_financiamiento,
-            linea,
-            codigo_categoria,
-            cargo,
-            horas_catedra,
-            fecha_ingreso,
-            tipo_personal,
-            lugar,
+            puestos,
+            entidad_keys,
+            cargos,
             monto_presupuestado,
-            monto_devengado,
-            anio_corte,
-            mes_corte,
-            fecha_corte
+            monto_devengado
         )
         SELECT
-            %(codigo_evento)s,
-            COALESCE(MAX(orden) + 1, 1),
-            %(anio)s, %(mes)s, %(codigo_persona)s, %(discapacidad)s,
-            %(nivel_key)s, %(entidad_key)s, %(programa_key)s, %(proyecto_key)s,
-            %(unidad_responsable_key)s, %(codigo_objecto_gasto)s, %(fuente_financiamiento)s, %(linea)s,
-            %(codigo_categoria)s, %(cargo)s, %(horas_catedra)s, %(fecha_ingreso)s,
-            %(tipo_personal)s, %(lugar)s, %(monto_presupuestado)s, %(monto_devengado)s,
-            %(anio_corte)s, %(mes_corte)s, %(fecha_corte)s
+            codigo_persona,
+            anio,
+            mes,
+            COUNT(1),
+            ARRAY_AGG(DISTINCT entidad_key),
+            ARRAY_AGG(DISTINCT cargo),
+            SUM(monto_presupuestado),
+            SUM(monto_devengado)
         FROM
-            pynomina.hacienda_pub_officers
+            pynomina.hacienda_pub_officers_v
         WHERE
-            codigo_evento = %(codigo_evento)s
+            anio = %(anio)s AND mes = %(mes)s
+        GROUP BY
+            codigo_persona, anio, mes
         """
-        for p in self._parsed_data.pub_officers:
-            # query = cur.mogrify(insert_pub_officer, asdict(p))
-            # print(query)
-            cur.execute(clean_current_month, {"anio": p.anio, "mes": p.mes})
-            break
-        cur.executemany(
-            insert_pub_officer, [asdict(p) for p in self._parsed_data.pub_officers]
-        )
+        cur.execute(clean_current_month, {"anio": anio, "mes": mes})
+        cur.execute(insert_timeline, {"anio": anio, "mes": mes})
@@ -1,8 +1,8 @@
 import logging
-from multiprocessing import cpu_count
+from typing import Any
 
+from psycopg import Connection
 from psycopg.rows import dict_row
-from psycopg.sql import SQL, Identifier
 from psycopg_pool import ConnectionPool
 
 from src.python.config import PGConf
@@ -10,14 +10,23 @@ from src.python.logger import Logger
 
 
 class NominaPgPool:
+    # Connections kept on top of the loaders for bookkeeping queries
+    # (download history, work queue, ...).
+    _spare_conns = 2
+
     _pool: ConnectionPool
     _started: bool
     _conf: PGConf
+    # Connections for the workers, LOADER_CONCURRENCY if not given
+    _pool_size: int | None
     log: logging.Logger
 
-    def __init__(self, conf: PGConf, log4py: Logger) -> None:
+    def __init__(
+        self, conf: PGConf, log4py: Logger, pool_size: int | None = None
+    ) -> None:
         self._conf = conf
         self.log = log4py.getLogger("NominaPgPool")
+        self._pool_size = pool_size
         self._started = False
 
     def _get_conn_str(self):
@@ -27,6 +36,24 @@ class NominaPgPool:
             f"application_name={self._conf.application_name}"
         )
 
+    def get_conninfo(self) -> str:
+        return self._get_conn_str()
+
+    def _get_pool_size(self) -> tuple[int, int]:
+        concurrency = max(1, self._pool_size or self._conf.loader_concurrency)
+        return concurrency, concurrency + self._spare_conns
+
+    def _configure(self, conn: Connection[Any]):
+        """Runs once on every new connection before it joins the pool."""
+        settings = {
+            "search_path": f"{self._conf.schema}, public",
+            "synchronous_commit": self._conf.synchronous_commit,
+            "work_mem": self._conf.work_mem,
+        }
+        for name, value in settings.items():
+            conn.execute("SELECT set_config(%s, %s, false)", (name, value))
+        conn.commit()
+
     def get_conn(self):
         if not self._started:
             self._start()
@@ -39,30 +66,55 @@ class NominaPgPool:
             self.log.info("Pool had started already, do nothing")
             return
         conninfo = self._get_conn_str()
+        min_size, max_size = self._get_pool_size()
         self._pool = ConnectionPool(
             conninfo=conninfo,
-            min_size=10 // cpu_count(),
-            max_size=30 // cpu_count(),
-            max_waiting=10,
+            min_size=min_size,
+            max_size=max_size,
+            max_waiting=self._conf.pool_max_waiting,
+            timeout=self._conf.pool_timeout,
             open=True,
+            configure=self._configure,
+            check=ConnectionPool.check_connection,
             kwargs={"row_factory": dict_row},
         )
-        self.log.info("Connection pool started")
-        with self._pool.connection() as conn:
-            self.log.info(f"SET search_path TO {self._conf.schema}")
-            conn.execute(
-                SQL("SET search_path TO {}, public;").format(
-                    Identifier(self._conf.schema)
-                )
-            )
-            conn.commit()
+        self.log.info(
+            f"Connection pool started (min_size={min_size}, max_size={max_size})"
+        )
         self._started = True
 
+    def get_stats(self) -> dict[str, int]:
+        """Returns the pool counters accumulated since the last call, from
+        every thread using the pool."""
+        if not self._started:
+            return {}
+        return self._pool.pop_stats()
+
+    def log_stats(self, label: str = "pool"):
+        stats = self.get_stats()
+        if not stats:
+            return
+        checkouts = stats.get("requests_num", 0)
+        wait_ms = stats.get("requests_wait_ms", 0)
+        self.log.info(
+            f"[{label}] checkouts={checkouts} "
+            f"queued={stats.get('requests_queued', 0)} "
+            f"wait_ms={wait_ms} "
+            f"avg_wait_ms={wait_ms / checkouts if checkouts else 0:.1f} "
+            f"errors={stats.get('requests_errors', 0)} "
+            f"bad_returns={stats.get('returns_bad', 0)} "
+            f"conn_errors={stats.get('connections_errors', 0)} "
+            f"conn_lost={stats.get('connections_lost', 0)} "
+            f"size={stats.get('pool_size', 0)}/{stats.get('pool_max', 0)} "
+            f"available={stats.get('pool_available', 0)}"
+        )
+
     def teardown(self):
         try:
             if not self._started:
                 self.log.info("Pool had been stopped already, do nothing")
                 return
+            self.log_stats("teardown")
             self._pool.close()
             self.log.info("Connection pool shutted down")
         except Exception as e:
@@ -0,0 +1,269 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg
+from psycopg_pool import PoolTimeout, TooManyRequests
+
+from src.python.channels import PERIOD_LOADED_CHANNEL
+from src.python.config import AppConfig
+from src.python.logger import Logger
+from src.python.postgres import NominaPgPool
+from src.python.timeline import PersonTimeline
+
+# Tag of cached results that depend on every period
+ALL_PERIODS = "*"
+
+
+class QueryCache:
+    """LRU cache of query results tagged with the period they depend on."""
+
+    max_entries: int
+    _entries: "OrderedDict[Tuple[Any, ...], Tuple[str, Any]]"
+    # Bumped on invalidation so results computed meanwhile are not stored
+    _generations: Dict[str, int]
+    # Bumped on clear, for every tag at once
+    _epoch: int
+    _lock: threading.Lock
+    hits: int
+    misses: int
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(
+        self, key: Tuple[Any, ...], periodo: str, compute: Callable[[], Any]
+    ) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][1]
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(periodo, 0))
+        value = compute()
+        with self._lock:
+            if (self._epoch, self._generations.get(periodo, 0)) != generation:
+                return value
+            self._entries[key] = (periodo, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, periodo: str) -> int:
+        """Drops the results of a period and the ones spanning every period."""
+        with self._lock:
+            for tag in (periodo, ALL_PERIODS):
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            stale = [
+                k
+                for k, (tag, _) in self._entries.items()
+                if tag in (periodo, ALL_PERIODS)
+            ]
+            for k in stale:
+                del self._entries[k]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+
+class PeriodInvalidationListener:
+    """LISTENs for committed periods and invalidates the cache accordingly.
+
+    Runs on its own connection outside the pool. After a lost connection the
+    whole cache is cleared, since notifications may have been missed.
+    """
+
+    _conninfo: str
+    _cache: QueryCache
+    _stop: threading.Event
+    log: logging.Logger
+
+    def __init__(self, conninfo: str, cache: QueryCache, log4py: Logger) -> None:
+        self.log = log4py.getLogger("PeriodInvalidationListener")
+        self._conninfo = conninfo
+        self._cache = cache
+        self._stop = threading.Event()
+
+    def _listen(self):
+        with psycopg.connect(self._conninfo, autocommit=True) as conn:
+            conn.execute(f"LISTEN {PERIOD_LOADED_CHANNEL}")
+            self._cache.clear()
+            self.log.info(f"listening on {PERIOD_LOADED_CHANNEL}")
+            while not self._stop.is_set():
+                for notify in conn.notifies(timeout=1.0):
+                    dropped = self._cache.invalidate(notify.payload)
+                    self.log.info(f"[{notify.payload}] loaded, {dropped} stale results")
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                self.log.error(e)
+                self._cache.clear()
+                time.sleep(5)
+
+    def start(self):
+        threading.Thread(target=self.run, name="cache-listener", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class NominaQueries:
+    """Common dashboard queries, cached until their period is reloaded."""
+
+    pgpool_mgr: NominaPgPool
+    cache: QueryCache
+    timeline: PersonTimeline
+
+    def __init__(
+        self, pgpool_mgr: NominaPgPool, cache: QueryCache, log4py: Logger
+    ) -> None:
+        self.pgpool_mgr = pgpool_mgr
+        self.cache = cache
+        self.timeline = PersonTimeline(pgpool_mgr=pgpool_mgr, log4py=log4py)
+
+    def _fetch(self, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            return cur.execute(query, params).fetchall()
+
+    def period_totals(self, periodo: str) -> Dict[str, Any]:
+        anio, mes = (int(p) for p in periodo.split("-"))
+        query = """
+        SELECT
+            COUNT(1) AS puestos,
+            COUNT(DISTINCT o.codigo_persona) AS personas,
+            SUM(o.monto_presupuestado)::INT8 AS monto_presupuestado,
+            SUM(o.monto_devengado)::INT8 AS monto_devengado
+        FROM
+            pynomina.hacienda_pub_officers o
+        WHERE
+            o.anio = %(anio)s AND o.mes = %(mes)s
+        """
+        return self.cache.get_or_compute(
+            ("period_totals", periodo),
+            periodo,
+            lambda: self._fetch(query, {"anio": anio, "mes": mes})[0],
+        )
+
+    def entidades(self, periodo: str) -> List[Dict[str, Any]]:
+        anio, mes = (int(p) for p in periodo.split("-"))
+        query = """
+        SELECT
+            o.entidad_key,
+            e.desc_entidad,
+            COUNT(1) AS puestos,
+            COUNT(DISTINCT o.codigo_persona) AS personas,
+            SUM(o.monto_presupuestado)::INT8 AS monto_presupuestado,
+            SUM(o.monto_devengado)::INT8 AS monto_devengado
+        FROM
+            pynomina.hacienda_pub_officers_v o
+        LEFT JOIN pynomina.hacienda_pub_officers_entidades e
+            ON e.entidad_key = o.entidad_key
+        WHERE
+            o.anio = %(anio)s AND o.mes = %(mes)s
+        GROUP BY
+            o.entidad_key, e.desc_entidad
+        ORDER BY
+            monto_devengado DESC NULLS LAST
+        """
+        return self.cache.get_or_compute(
+            ("entidades", periodo),
+            periodo,
+            lambda: self._fetch(query, {"anio": anio, "mes": mes}),
+        )
+
+    def persona(self, codigo_persona: str) -> List[Dict[str, Any]]:
+        return self.cache.get_or_compute(
+            ("persona", codigo_persona),
+            ALL_PERIODS,
+            lambda: [asdict(p) for p in self.timeline.get(codigo_persona)],
+        )
+
+
+def make_handler(queries: NominaQueries) -> type[BaseHTTPRequestHandler]:
+    routes: List[Tuple[re.Pattern[str], Callable[[str], Any]]] = [
+        (re.compile(r"^/periods/(\d{4}-\d{2})/totals$"), queries.period_totals),
+        (re.compile(r"^/periods/(\d{4}-\d{2})/entidades$"), queries.entidades),
+        (re.compile(r"^/personas/([^/]+)$"), queries.persona),
+    ]
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Any):
+            payload = json.dumps(body, default=str, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/health":
+                cache = queries.cache
+                self._send(200, {"hits": cache.hits, "misses": cache.misses})
+                return
+            for pattern, query in routes:
+                if match := pattern.match(path):
+                    try:
+                        self._send(200, query(match.group(1)))
+                    except (TooManyRequests, PoolTimeout) as e:
+                        # Every pooled connection is busy, the client may retry
+                        self._send(503, {"error": str(e)})
+                    except Exception as e:
+                        self._send(500, {"error": str(e)})
+                    return
+            self._send(404, {"error": f"unknown path {path}"})
+
+        def log_message(self, format: str, *args: Any):
+            pass
+
+    return Handler
+
+
+def serve(
+    host: str,
+    port: int,
+    config_file_path: str,
+    max_entries: int = 1024,
+    pool_size: int = 10,
+):
+    """Serves the queries, ``pool_size`` connections run them concurrently."""
+    log4py = Logger()
+    log = log4py.getLogger("ReadService")
+    config = AppConfig(log4py=log4py, config_file_path=config_file_path).read_config()
+    pgpool_mgr = NominaPgPool(conf=config.pg, log4py=log4py, pool_size=pool_size)
+    cache = QueryCache(max_entries=max_entries)
+    listener = PeriodInvalidationListener(
+        conninfo=pgpool_mgr.get_conninfo(), cache=cache, log4py=log4py
+    )
+    queries = NominaQueries(pgpool_mgr=pgpool_mgr, cache=cache, log4py=log4py)
+    server = ThreadingHTTPServer((host, port), make_handler(queries))
+    listener.start()
+    log.info(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+        server.server_close()
+        pgpool_mgr.teardown()
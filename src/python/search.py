@@ -0,0 +1,124 @@
+import logging
+import re
+from typing import List
+
+from pydantic.dataclasses import dataclass
+
+from src.python.logger import Logger
+from src.python.pipeline import normalize_name
+from src.python.postgres import NominaPgPool
+
+
+@dataclass(frozen=True)
+class PersonaMatch:
+    codigo_persona: str
+    nombres: str | None
+    apellidos: str | None
+    score: float
+
+
+@dataclass(frozen=True)
+class SearchPage:
+    matches: List[PersonaMatch]
+    # Pass back as ``after`` to get the next page, None on the last page
+    next_after: tuple[float, str] | None
+
+
+class PersonaSearch:
+    """Accent insensitive, ranked name search over ``public.py_personas``.
+
+    Candidates come from the trigram (``<%``) and full text (``@@``) indexes
+    on ``nombre_busqueda``/``search_tsv``, pages are cut with a
+    ``(score, codigo_persona)`` keyset instead of ``OFFSET``.
+
+    Only ``max_candidates`` names per index are ranked, the trigram ones
+    closest first through the GiST index (``<<->``), so a page costs the
+    same for "maria" as for a rare name. The trade-off: the pages of a very
+    common name end once those candidates are exhausted, and full text
+    candidates beyond the cap are picked in no particular order. A longer
+    search text narrows them down.
+    """
+
+    # Names taken from each index before ranking, every page ranks them again
+    max_candidates = 1000
+
+    pgpool_mgr: NominaPgPool
+    log: logging.Logger
+
+    def __init__(self, pgpool_mgr: NominaPgPool, log4py: Logger) -> None:
+        self.log = log4py.getLogger("PersonaSearch")
+        self.pgpool_mgr = pgpool_mgr
+
+    @staticmethod
+    def _to_tsquery(terms: List[str]) -> str:
+        return " & ".join(f"{t}:*" for t in terms)
+
+    def search(
+        self, text: str, limit: int = 20, after: tuple[float, str] | None = None
+    ) -> SearchPage:
+        normalized = normalize_name(text)
+        terms = [t for t in (re.sub(r"\W", "", w) for w in normalized.split()) if t]
+        if not terms:
+            return SearchPage(matches=[], next_after=None)
+
+        query = """
+        SELECT
+            s.codigo_persona,
+            s.nombres,
+            s.apellidos,
+            s.score
+        FROM (
+            SELECT
+                p.codigo_persona,
+                p.nombres,
+                p.apellidos,
+                (
+                    WORD_SIMILARITY(%(q)s, p.nombre_busqueda)
+                    + TS_RANK(p.search_tsv, TO_TSQUERY('simple', %(tsq)s))
+                )::FLOAT8 AS score
+            FROM (
+                (
+                    SELECT
+                        t.codigo_persona
+                    FROM
+                        public.py_personas t
+                    WHERE
+                        %(q)s <%% t.nombre_busqueda
+                    ORDER BY
+                        %(q)s <<-> t.nombre_busqueda
+                    LIMIT %(max_candidates)s
+                )
+                UNION
+                (
+                    SELECT
+                        f.codigo_persona
+                    FROM
+                        public.py_personas f
+                    WHERE
+                        f.search_tsv @@ TO_TSQUERY('simple', %(tsq)s)
+                    LIMIT %(max_candidates)s
+                )
+            ) c
+            JOIN public.py_personas p ON p.codigo_persona = c.codigo_persona
+        ) s
+        WHERE
+            %(after_score)s::FLOAT8 IS NULL
+            OR (s.score, s.codigo_persona) < (%(after_score)s::FLOAT8, %(after_codigo)s::TEXT)
+        ORDER BY
+            s.score DESC, s.codigo_persona DESC
+        LIMIT %(limit)s
+        """
+        params = {
+            "q": " ".join(terms),
+            "tsq": self._to_tsquery(terms),
+            "after_score": after[0] if after else None,
+            "after_codigo": after[1] if after else None,
+            "limit": limit,
+            "max_candidates": self.max_candidates,
+        }
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            matches = [PersonaMatch(**row) for row in cur.execute(query, params)]
+        next_after = None
+        if len(matches) == limit:
+            next_after = (matches[-1].score, matches[-1].codigo_persona)
+        return SearchPage(matches=matches, next_after=next_after)
@@ -0,0 +1,118 @@
+import logging
+import threading
+from dataclasses import asdict, astuple, fields
+from typing import Any, Collection, Dict, List, Set
+
+from psycopg import Cursor
+from psycopg.sql import SQL, Identifier, Placeholder
+
+from src.python.logger import Logger
+from src.python.postgres import NominaPgPool
+
+# dimension -> (table, natural key column, surrogate key column)
+DIMENSIONS: Dict[str, tuple[str, str, str]] = {
+    "nivel": ("hacienda_pub_officers_niveles", "nivel_key", "nivel_id"),
+    "entidad": ("hacienda_pub_officers_entidades", "entidad_key", "entidad_id"),
+    "programa": ("hacienda_pub_officers_programas", "programa_key", "programa_id"),
+    "proyecto": ("hacienda_pub_officers_proyectos", "proyecto_key", "proyecto_id"),
+    "unidad": (
+        "hacienda_pub_officers_responsables",
+        "unidad_responsable_key",
+        "unidad_responsable_id",
+    ),
+}
+
+
+class DimensionKeyCache:
+    """Maps dimension natural keys to their integer surrogate keys.
+
+    Each dimension table is read once per run, afterwards only keys never seen
+    before and rows whose descriptions changed go to the database. Those are
+    committed on their own connection right away, so a cached id is always
+    visible to every loader thread sharing the cache.
+    """
+
+    pgpool_mgr: NominaPgPool
+    _keys: Dict[str, Dict[str, int]]
+    _rows: Dict[str, Dict[str, tuple]]
+    _warm: Set[str]
+    _lock: threading.Lock
+    log: logging.Logger
+
+    def __init__(self, pgpool_mgr: NominaPgPool, log4py: Logger) -> None:
+        self.log = log4py.getLogger("DimensionKeyCache")
+        self.pgpool_mgr = pgpool_mgr
+        self._keys = {dimension: {} for dimension in DIMENSIONS}
+        self._rows = {dimension: {} for dimension in DIMENSIONS}
+        self._warm = set()
+        self._lock = threading.Lock()
+
+    def _warm_up(self, cur: Cursor[Any], dimension: str, columns: List[str]):
+        table, key_col, id_col = DIMENSIONS[dimension]
+        query = SQL("SELECT {id} AS id, {columns} FROM {table}").format(
+            id=Identifier(id_col),
+            columns=SQL(", ").join(Identifier(c) for c in columns),
+            table=Identifier("pynomina", table),
+        )
+        rows = cur.execute(query).fetchall()
+        self._keys[dimension] = {r[key_col]: r["id"] for r in rows}
+        self._rows[dimension] = {r[key_col]: tuple(r[c] for c in columns) for r in rows}
+        self._warm.add(dimension)
+        self.log.info(f"warmed up {dimension}={len(rows)}")
+
+    def _changed(self, dimension: str, items: Collection[Any]) -> List[Any]:
+        """Items whose natural key is not cached or whose row differs."""
+        key_col = DIMENSIONS[dimension][1]
+        cached = self._rows[dimension]
+        by_key = {getattr(i, key_col): i for i in items}
+        return [i for k, i in by_key.items() if cached.get(k) != astuple(i)]
+
+    def resolve(self, dimension: str, items: Collection[Any]):
+        """Upserts the dimension rows that are new or changed since cached."""
+        if not items:
+            return
+        table, key_col, id_col = DIMENSIONS[dimension]
+        with self._lock:
+            if dimension in self._warm and not self._changed(dimension, items):
+                return
+            with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+                columns = [f.name for f in fields(next(iter(items)))]
+                if dimension not in self._warm:
+                    self._warm_up(cur, dimension, columns)
+                changed = self._changed(dimension, items)
+                if not changed:
+                    return
+                query = SQL("""
+                    INSERT INTO {table} ({columns})
+                    VALUES ({values})
+                    ON CONFLICT ({key})
+                    DO UPDATE SET {updates}
+                    RETURNING {key} AS key, {id} AS id
+                    """).format(
+                    table=Identifier("pynomina", table),
+                    columns=SQL(", ").join(Identifier(c) for c in columns),
+                    values=SQL(", ").join(Placeholder(c) for c in columns),
+                    key=Identifier(key_col),
+                    updates=SQL(", ").join(
+                        SQL("{col} = EXCLUDED.{col}").format(col=Identifier(c))
+                        for c in columns
+                        if c != key_col
+                    ),
+                    id=Identifier(id_col),
+                )
+                cur.executemany(query, [asdict(i) for i in changed], returning=True)
+                known = self._keys[dimension]
+                while True:
+                    for r in cur.fetchall():
+                        known[r["key"]] = r["id"]
+                    if not cur.nextset():
+                        break
+                self._rows[dimension].update(
+                    (getattr(i, key_col), astuple(i)) for i in changed
+                )
+                self.log.debug(f"{dimension}: {len(changed)} new or changed keys")
+
+    def get(self, dimension: str, key: str | None) -> int | None:
+        if key is None:
+            return None
+        return self._keys[dimension][key]
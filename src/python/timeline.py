@@ -0,0 +1,112 @@
+import logging
+from datetime import date
+from typing import Dict, List
+
+from pydantic.dataclasses import dataclass
+
+from src.python.logger import Logger
+from src.python.postgres import NominaPgPool
+
+
+@dataclass(frozen=True)
+class PersonPosition:
+    codigo_persona: str
+    anio: int
+    mes: int
+    orden: int
+    entidad_key: str | None
+    desc_entidad: str | None
+    codigo_objecto_gasto: str | None
+    cargo: str | None
+    tipo_personal: str | None
+    fecha_ingreso: date | None
+    monto_presupuestado: int | None
+    monto_devengado: int | None
+
+
+@dataclass(frozen=True)
+class PersonPeriod:
+    codigo_persona: str
+    anio: int
+    mes: int
+    puestos: int
+    entidad_keys: List[str | None]
+    cargos: List[str | None]
+    monto_presupuestado: int | None
+    monto_devengado: int | None
+
+
+class PersonTimeline:
+    """Looks up the positions and pay of people across every loaded period.
+
+    Lookups hit the ``(codigo_persona, anio, mes)`` indexes, so they cost a
+    few index probes per person instead of a scan of the fact table.
+    """
+
+    pgpool_mgr: NominaPgPool
+    log: logging.Logger
+
+    def __init__(self, pgpool_mgr: NominaPgPool, log4py: Logger) -> None:
+        self.log = log4py.getLogger("PersonTimeline")
+        self.pgpool_mgr = pgpool_mgr
+
+    def get_positions(self, codigos: List[str]) -> Dict[str, List[PersonPosition]]:
+        """Returns every position held by each person, ordered by period."""
+        query = """
+        SELECT
+            o.codigo_persona,
+            o.anio,
+            o.mes,
+            o.orden,
+            o.entidad_key,
+            e.desc_entidad,
+            o.codigo_objecto_gasto,
+            o.cargo,
+            o.tipo_personal,
+            o.fecha_ingreso,
+            o.monto_presupuestado,
+            o.monto_devengado
+        FROM
+            pynomina.hacienda_pub_officers_v o
+        LEFT JOIN pynomina.hacienda_pub_officers_entidades e
+            ON e.entidad_key = o.entidad_key
+        WHERE
+            o.codigo_persona = ANY(%(codigos)s)
+        ORDER BY
+            o.codigo_persona, o.anio, o.mes, o.orden
+        """
+        timelines: Dict[str, List[PersonPosition]] = {c: [] for c in codigos}
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            for row in cur.execute(query, {"codigos": list(codigos)}):
+                position = PersonPosition(**row)
+                timelines[position.codigo_persona].append(position)
+        return timelines
+
+    def get_periods(self, codigos: List[str]) -> Dict[str, List[PersonPeriod]]:
+        """Returns the compact per-period history maintained by the loader."""
+        query = """
+        SELECT
+            t.codigo_persona,
+            t.anio,
+            t.mes,
+            t.puestos,
+            t.entidad_keys,
+            t.cargos,
+            t.monto_presupuestado,
+            t.monto_devengado
+        FROM
+            pynomina.hacienda_pub_officers_timeline t
+        WHERE
+            t.codigo_persona = ANY(%(codigos)s)
+        ORDER BY
+            t.codigo_persona, t.anio, t.mes
+        """
+        timelines: Dict[str, List[PersonPeriod]] = {c: [] for c in codigos}
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            for row in cur.execute(query, {"codigos": list(codigos)}):
+                period = PersonPeriod(**row)
+                timelines[period.codigo_persona].append(period)
+        return timelines
+
+    def get(self, codigo_persona: str) -> List[PersonPosition]:
+        return self.get_positions([codigo_persona])[codigo_persona]
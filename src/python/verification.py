@@ -0,0 +1,427 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List
+
+from psycopg import Cursor
+from psycopg.types.json import Jsonb
+from pydantic.dataclasses import dataclass
+
+from src.python.logger import Logger
+from src.python.postgres import NominaPgPool
+
+if TYPE_CHECKING:
+    # Only the loader has the rows, verify does not import the pipeline
+    from src.python.pipeline import PubOfficer
+
+# Columns hashed per row, dates and booleans are left out since their text
+# form differs between python and postgres. NULLs are skipped on both sides.
+HASHED_COLUMNS = (
+    "codigo_evento",
+    "codigo_persona",
+    "nivel_key",
+    "entidad_key",
+    "programa_key",
+    "proyecto_key",
+    "unidad_responsable_key",
+    "codigo_objecto_gasto",
+    "fuente_financiamiento",
+    "linea",
+    "codigo_categoria",
+    "cargo",
+    "horas_catedra",
+    "tipo_personal",
+    "lugar",
+    "monto_presupuestado",
+    "monto_devengado",
+)
+# Columns whose groups are compared one by one, a NULL key is stored as ""
+DIMENSION_COLUMNS = ("entidad_key", "codigo_objecto_gasto")
+
+
+@dataclass
+class Aggregate:
+    num_rows: int = 0
+    monto_presupuestado: int = 0
+    monto_devengado: int = 0
+    row_hash: int = 0
+
+
+@dataclass
+class PeriodFingerprint:
+    anio: int
+    mes: int
+    rows_read: int | None
+    rows_rejected: int | None
+    rows_duplicated: int | None
+    personas: int
+    totals: Aggregate
+    dimensions: Dict[str, Dict[str, Aggregate]]
+
+
+@dataclass
+class Discrepancy:
+    scope: str  # "total" or "{column}={key}"
+    metric: str
+    expected: int | None
+    actual: int | None
+
+
+@dataclass
+class VerificationReport:
+    periodo: str
+    # OK, MISMATCH, MISSING (loaded before fingerprints existed) or ERROR
+    status: str
+    rows_read: int | None
+    rows_rejected: int | None
+    rows_duplicated: int | None
+    expected_rows: int | None
+    actual_rows: int | None
+    discrepancies: List[Discrepancy]
+    error: str | None = None
+
+
+def row_digest(values: Iterable[Any]) -> int:
+    """Signed 64 bit prefix of the md5 of the non NULL values joined by |."""
+    text = "|".join(str(v) for v in values if v is not None)
+    digest = int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "big")
+    return digest - (1 << 64) if digest >= 1 << 63 else digest
+
+
+def _add(
+    aggregate: Aggregate, presupuestado: int | None, devengado: int | None, digest: int
+):
+    aggregate.num_rows += 1
+    aggregate.monto_presupuestado += presupuestado or 0
+    aggregate.monto_devengado += devengado or 0
+    aggregate.row_hash += digest
+
+
+def fingerprint(
+    anio: int,
+    mes: int,
+    pub_officers: Iterable["PubOfficer"],
+    rows_read: int | None = None,
+    rows_rejected: int | None = None,
+    rows_duplicated: int | None = None,
+) -> PeriodFingerprint:
+    """Order independent aggregates of the rows a period is about to store."""
+    totals = Aggregate()
+    dimensions: Dict[str, Dict[str, Aggregate]] = {c: {} for c in DIMENSION_COLUMNS}
+    personas = set()
+    for p in pub_officers:
+        digest = row_digest(getattr(p, c) for c in HASHED_COLUMNS)
+        _add(totals, p.monto_presupuestado, p.monto_devengado, digest)
+        for column, groups in dimensions.items():
+            key = getattr(p, column)
+            key = "" if key is None else str(key)
+            if key not in groups:
+                groups[key] = Aggregate()
+            _add(groups[key], p.monto_presupuestado, p.monto_devengado, digest)
+        personas.add(p.codigo_persona)
+    return PeriodFingerprint(
+        anio=anio,
+        mes=mes,
+        rows_read=rows_read,
+        rows_rejected=rows_rejected,
+        rows_duplicated=rows_duplicated,
+        personas=len(personas),
+        totals=totals,
+        dimensions=dimensions,
+    )
+
+
+def compare(
+    expected: PeriodFingerprint, actual: PeriodFingerprint
+) -> List[Discrepancy]:
+    discrepancies: List[Discrepancy] = []
+
+    def compare_aggregates(scope: str, e: Aggregate | None, a: Aggregate | None):
+        for metric in (
+            "num_rows",
+            "monto_presupuestado",
+            "monto_devengado",
+            "row_hash",
+        ):
+            e_value = None if e is None else getattr(e, metric)
+            a_value = None if a is None else getattr(a, metric)
+            if e_value != a_value:
+                discrepancies.append(Discrepancy(scope, metric, e_value, a_value))
+
+    compare_aggregates("total", expected.totals, actual.totals)
+    if expected.personas != actual.personas:
+        discrepancies.append(
+            Discrepancy("total", "personas", expected.personas, actual.personas)
+        )
+    for column in DIMENSION_COLUMNS:
+        e_groups = expected.dimensions.get(column, {})
+        a_groups = actual.dimensions.get(column, {})
+        for key in sorted(e_groups.keys() | a_groups.keys()):
+            e, a = e_groups.get(key), a_groups.get(key)
+            if e != a:
+                compare_aggregates(f"{column}={key}", e, a)
+    return discrepancies
+
+
+class PeriodVerifier:
+    """Checks stored periods against the fingerprint taken while parsing.
+
+    The fingerprint is saved in the load transaction. Verifying a period
+    recomputes the same aggregates in postgres with one pass over the
+    period's rows (hacienda_pub_officers_periodo_idx) and diffs them.
+    """
+
+    pgpool_mgr: NominaPgPool
+    log: logging.Logger
+
+    def __init__(self, pgpool_mgr: NominaPgPool, log4py: Logger) -> None:
+        self.log = log4py.getLogger("PeriodVerifier")
+        self.pgpool_mgr = pgpool_mgr
+
+    def save(self, cur: Cursor[Any], fp: PeriodFingerprint):
+        upsert_fingerprint = """
+        INSERT INTO pynomina.hacienda_pub_officers_fingerprints (
+            anio,
+            mes,
+            rows_read,
+            rows_rejected,
+            rows_duplicated,
+            num_rows,
+            personas,
+            monto_presupuestado,
+            monto_devengado,
+            row_hash,
+            dimensions
+        )
+        VALUES (
+            %(anio)s, %(mes)s, %(rows_read)s, %(rows_rejected)s, %(rows_duplicated)s,
+            %(num_rows)s, %(personas)s, %(monto_presupuestado)s, %(monto_devengado)s,
+            %(row_hash)s, %(dimensions)s
+        )
+        ON CONFLICT (anio, mes)
+        DO UPDATE SET
+            rows_read = EXCLUDED.rows_read,
+            rows_rejected = EXCLUDED.rows_rejected,
+            rows_duplicated = EXCLUDED.rows_duplicated,
+            num_rows = EXCLUDED.num_rows,
+            personas = EXCLUDED.personas,
+            monto_presupuestado = EXCLUDED.monto_presupuestado,
+            monto_devengado = EXCLUDED.monto_devengado,
+            row_hash = EXCLUDED.row_hash,
+            dimensions = EXCLUDED.dimensions,
+            computed_at_utc = (NOW() AT TIME ZONE 'utc'),
+            verified_at_utc = NULL,
+            verified_ok = NULL,
+            discrepancies = NULL
+        """
+        dimensions = {
+            column: {k: list(asdict(a).values()) for k, a in groups.items()}
+            for column, groups in fp.dimensions.items()
+        }
+        cur.execute(
+            upsert_fingerprint,
+            {
+                "anio": fp.anio,
+                "mes": fp.mes,
+                "rows_read": fp.rows_read,
+                "rows_rejected": fp.rows_rejected,
+                "rows_duplicated": fp.rows_duplicated,
+                "personas": fp.personas,
+                "dimensions": Jsonb(dimensions),
+            }
+            | asdict(fp.totals),
+        )
+
+    def publish(
+        self,
+        cur: Cursor[Any],
+        anio_mes: str,
+        pub_officers: Iterable["PubOfficer"],
+        rows_read: int,
+        rows_rejected: int,
+        rows_duplicated: int,
+    ) -> PeriodFingerprint:
+        anio, mes = (int(p) for p in anio_mes.split("-"))
+        fp = fingerprint(
+            anio, mes, pub_officers, rows_read, rows_rejected, rows_duplicated
+        )
+        self.save(cur, fp)
+        return fp
+
+    def _load(self, cur: Cursor[Any], anio: int, mes: int) -> PeriodFingerprint | None:
+        query = """
+        SELECT
+            *
+        FROM
+            pynomina.hacienda_pub_officers_fingerprints
+        WHERE
+            anio = %(anio)s AND mes = %(mes)s
+        """
+        row = cur.execute(query, {"anio": anio, "mes": mes}).fetchone()
+        if row is None:
+            return None
+        return PeriodFingerprint(
+            anio=anio,
+            mes=mes,
+            rows_read=row["rows_read"],
+            rows_rejected=row["rows_rejected"],
+            rows_duplicated=row["rows_duplicated"],
+            personas=row["personas"],
+            totals=Aggregate(
+                num_rows=row["num_rows"],
+                monto_presupuestado=int(row["monto_presupuestado"]),
+                monto_devengado=int(row["monto_devengado"]),
+                row_hash=int(row["row_hash"]),
+            ),
+            dimensions={
+                column: {k: Aggregate(*v) for k, v in groups.items()}
+                for column, groups in row["dimensions"].items()
+            },
+        )
+
+    def _aggregate(self, cur: Cursor[Any], anio: int, mes: int) -> PeriodFingerprint:
+        """Same aggregates as ``fingerprint`` over the stored rows, one scan."""
+        row_text = ", ".join(f"o.{c}" for c in HASHED_COLUMNS)
+        query = f"""
+        SELECT
+            GROUPING(o.entidad_key) AS by_entidad,
+            GROUPING(o.codigo_objecto_gasto) AS by_objecto_gasto,
+            COALESCE(o.entidad_key, '') AS entidad_key,
+            COALESCE(o.codigo_objecto_gasto, '') AS codigo_objecto_gasto,
+            COUNT(1) AS num_rows,
+            COUNT(DISTINCT o.codigo_persona) AS personas,
+            COALESCE(SUM(o.monto_presupuestado), 0) AS monto_presupuestado,
+            COALESCE(SUM(o.monto_devengado), 0) AS monto_devengado,
+            COALESCE(
+                SUM(('x' || SUBSTR(MD5(CONCAT_WS('|', {row_text})), 1, 16))::BIT(64)::INT8),
+                0
+            ) AS row_hash
+        FROM
+            pynomina.hacienda_pub_officers_v o
+        WHERE
+            o.anio = %(anio)s AND o.mes = %(mes)s
+        GROUP BY
+            GROUPING SETS ((o.entidad_key), (o.codigo_objecto_gasto), ())
+        """
+        totals = Aggregate()
+        personas = 0
+        dimensions: Dict[str, Dict[str, Aggregate]] = {c: {} for c in DIMENSION_COLUMNS}
+        for r in cur.execute(query, {"anio": anio, "mes": mes}):
+            aggregate = Aggregate(
+                num_rows=r["num_rows"],
+                monto_presupuestado=int(r["monto_presupuestado"]),
+                monto_devengado=int(r["monto_devengado"]),
+                row_hash=int(r["row_hash"]),
+            )
+            if r["by_entidad"] and r["by_objecto_gasto"]:
+                totals, personas = aggregate, r["personas"]
+            elif not r["by_entidad"]:
+                dimensions["entidad_key"][r["entidad_key"]] = aggregate
+            else:
+                dimensions["codigo_objecto_gasto"][
+                    r["codigo_objecto_gasto"]
+                ] = aggregate
+        return PeriodFingerprint(
+            anio=anio,
+            mes=mes,
+            rows_read=None,
+            rows_rejected=None,
+            rows_duplicated=None,
+            personas=personas,
+            totals=totals,
+            dimensions=dimensions,
+        )
+
+    def _record(
+        self, cur: Cursor[Any], anio: int, mes: int, report: VerificationReport
+    ):
+        update_fingerprint = """
+        UPDATE pynomina.hacienda_pub_officers_fingerprints SET
+            verified_at_utc = (NOW() AT TIME ZONE 'utc'),
+            verified_ok = %(verified_ok)s,
+            discrepancies = %(discrepancies)s
+        WHERE
+            anio = %(anio)s AND mes = %(mes)s
+        """
+        cur.execute(
+            update_fingerprint,
+            {
+                "anio": anio,
+                "mes": mes,
+                "verified_ok": report.status == "OK",
+                "discrepancies": Jsonb([asdict(d) for d in report.discrepancies]),
+            },
+        )
+
+    def verify(self, periodo: str) -> VerificationReport:
+        anio, mes = (int(p) for p in periodo.split("-"))
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            expected = self._load(cur, anio, mes)
+            actual = self._aggregate(cur, anio, mes)
+            if expected is None:
+                return VerificationReport(
+                    periodo=periodo,
+                    status="MISSING",
+                    rows_read=None,
+                    rows_rejected=None,
+                    rows_duplicated=None,
+                    expected_rows=None,
+                    actual_rows=actual.totals.num_rows,
+                    discrepancies=[],
+                )
+            discrepancies = compare(expected, actual)
+            report = VerificationReport(
+                periodo=periodo,
+                status="MISMATCH" if discrepancies else "OK",
+                rows_read=expected.rows_read,
+                rows_rejected=expected.rows_rejected,
+                rows_duplicated=expected.rows_duplicated,
+                expected_rows=expected.totals.num_rows,
+                actual_rows=actual.totals.num_rows,
+                discrepancies=discrepancies,
+            )
+            self._record(cur, anio, mes, report)
+        if discrepancies:
+            self.log.warning(f"[{periodo}] {len(discrepancies)} discrepancies")
+        return report
+
+    def fingerprinted_periods(self) -> List[str]:
+        query = """
+        SELECT
+            anio,
+            mes
+        FROM
+            pynomina.hacienda_pub_officers_fingerprints
+        ORDER BY
+            anio, mes
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            return [f"{r['anio']}-{r['mes']:02}" for r in cur.execute(query)]
+
+    def verify_all(
+        self, periods: List[str] | None, workers: int
+    ) -> Iterable[VerificationReport]:
+        """Verifies the given periods, every fingerprinted one if None, in parallel."""
+        periods = periods or self.fingerprinted_periods()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            yield from executor.map(self._verify_or_error, periods)
+
+    def _verify_or_error(self, periodo: str) -> VerificationReport:
+        """Like ``verify``, a failing period gives an ERROR report instead of
+        stopping the other ones."""
+        try:
+            return self.verify(periodo)
+        except Exception as e:
+            self.log.error(f"[{periodo}] {e}")
+            return VerificationReport(
+                periodo=periodo,
+                status="ERROR",
+                rows_read=None,
+                rows_rejected=None,
+                rows_duplicated=None,
+                expected_rows=None,
+                actual_rows=None,
+                discrepancies=[],
+                error=f"{type(e).__name__}: {e}",
+            )
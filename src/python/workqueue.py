@@ -0,0 +1,304 @@
+import logging
+import os
+import socket
+import threading
+from dataclasses import asdict
+from typing import Any, List
+
+from psycopg import Cursor
+
+from src.python.logger import Logger
+from src.python.periods import AvailableData
+from src.python.postgres import NominaPgPool
+
+
+class LeaseLostError(Exception):
+    """The claim on a period expired or was taken over by another worker."""
+
+
+class PeriodWorkQueue:
+    """Postgres backed queue of periods shared by every loader node.
+
+    Periods are claimed with ``FOR UPDATE SKIP LOCKED`` so concurrent workers
+    never get the same period, and every claim carries a lease that must be
+    renewed by a heartbeat. Claims whose lease expired (crashed or stuck
+    worker) become claimable again.
+    """
+
+    pgpool_mgr: NominaPgPool
+    lease_seconds: int
+    log: logging.Logger
+
+    def __init__(
+        self, pgpool_mgr: NominaPgPool, lease_seconds: int, log4py: Logger
+    ) -> None:
+        self.log = log4py.getLogger("PeriodWorkQueue")
+        self.pgpool_mgr = pgpool_mgr
+        self.lease_seconds = lease_seconds
+
+    @staticmethod
+    def new_worker_id(worker: int) -> str:
+        return f"{socket.gethostname()}-{os.getpid()}-{worker}"
+
+    def enqueue(self, available_data: List[AvailableData]):
+        """Adds new periods, failed periods are put back as pending.
+
+        The fecha_creacion of a known period is left as is, only ``complete``
+        moves it forward, so a republished period failing to reload is still
+        found changed.
+        """
+        query = """
+        INSERT INTO public.download_queue (
+            periodo,
+            resource_url,
+            fecha_creacion
+        )
+        VALUES (
+            %(periodo)s, %(resource_url)s, %(fechaCreacion)s
+        )
+        ON CONFLICT (periodo)
+        DO UPDATE SET
+            stat = 'PENDING'::public.queue_stat
+        WHERE
+            download_queue.stat = 'FAILED'::public.queue_stat
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            cur.executemany(query, [asdict(ad) for ad in available_data])
+
+    def requeue(self, periods: List[str]):
+        """Puts loaded or failed periods back as pending, to load them again."""
+        query = """
+        UPDATE public.download_queue
+        SET
+            stat = 'PENDING'::public.queue_stat
+        WHERE
+            periodo = ANY(%(periods)s)
+            AND stat IN ('DONE'::public.queue_stat, 'FAILED'::public.queue_stat)
+        """
+        if not periods:
+            return
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            cur.execute(query, {"periods": periods})
+
+    def count_claimable(self) -> int:
+        query = """
+        SELECT
+            COUNT(1) AS pending
+        FROM
+            public.download_queue q
+        WHERE
+            q.stat = 'PENDING'::public.queue_stat
+            OR (
+                q.stat = 'CLAIMED'::public.queue_stat
+                AND q.lease_until < (NOW() AT TIME ZONE 'utc')
+            )
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            row = cur.execute(query).fetchone()
+            return int(row["pending"]) if row else 0
+
+    def claim(self, worker_id: str, periodo: str | None = None) -> AvailableData | None:
+        """Claims the oldest pending period, or one whose lease expired.
+
+        With ``periodo`` only that period is claimed, if it is claimable.
+        """
+        query = """
+        UPDATE public.download_queue q
+        SET
+            stat = 'CLAIMED'::public.queue_stat,
+            claimed_by = %(worker_id)s,
+            claimed_at = (NOW() AT TIME ZONE 'utc'),
+            heartbeat_at = (NOW() AT TIME ZONE 'utc'),
+            lease_until = (NOW() AT TIME ZONE 'utc') + MAKE_INTERVAL(secs => %(lease)s),
+            attempts = q.attempts + 1
+        WHERE
+            q.periodo = (
+                SELECT
+                    c.periodo
+                FROM
+                    public.download_queue c
+                WHERE
+                    (
+                        c.stat = 'PENDING'::public.queue_stat
+                        OR (
+                            c.stat = 'CLAIMED'::public.queue_stat
+                            AND c.lease_until < (NOW() AT TIME ZONE 'utc')
+                        )
+                    )
+                    AND (%(periodo)s::TEXT IS NULL OR c.periodo = %(periodo)s)
+                ORDER BY
+                    c.periodo
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+        RETURNING
+            q.periodo,
+            q.resource_url,
+            q.fecha_creacion,
+            q.claimed_by
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            row = cur.execute(
+                query,
+                {
+                    "worker_id": worker_id,
+                    "lease": self.lease_seconds,
+                    "periodo": periodo,
+                },
+            ).fetchone()
+        if row is None:
+            return None
+        self.log.info(f"[{row['periodo']}] claimed by {worker_id}")
+        return AvailableData(
+            dataset="nomina",
+            periodo=row["periodo"],
+            fechaCreacion=row["fecha_creacion"] or "",
+            resource_url=row["resource_url"],
+        )
+
+    def heartbeat(self, periodo: str, worker_id: str) -> bool:
+        """Extends the lease, returns False if the claim was lost."""
+        query = """
+        UPDATE public.download_queue
+        SET
+            heartbeat_at = (NOW() AT TIME ZONE 'utc'),
+            lease_until = (NOW() AT TIME ZONE 'utc') + MAKE_INTERVAL(secs => %(lease)s)
+        WHERE
+            periodo = %(periodo)s
+            AND claimed_by = %(worker_id)s
+            AND stat = 'CLAIMED'::public.queue_stat
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                query,
+                {
+                    "periodo": periodo,
+                    "worker_id": worker_id,
+                    "lease": self.lease_seconds,
+                },
+            )
+            return cur.rowcount > 0
+
+    def fence(self, cur: Cursor[Any], periodo: str, worker_id: str):
+        """Fails the load transaction of ``cur`` unless the claim is still held.
+
+        The queue row stays locked until that transaction ends, so the period
+        cannot be reclaimed between this check and the commit.
+        """
+        query = """
+        SELECT
+            q.periodo
+        FROM
+            public.download_queue q
+        WHERE
+            q.periodo = %(periodo)s
+            AND q.claimed_by = %(worker_id)s
+            AND q.stat = 'CLAIMED'::public.queue_stat
+        FOR UPDATE
+        """
+        row = cur.execute(
+            query, {"periodo": periodo, "worker_id": worker_id}
+        ).fetchone()
+        if row is None:
+            raise LeaseLostError(f"[{periodo}] lease lost by {worker_id}")
+
+    def _finish(
+        self,
+        periodo: str,
+        worker_id: str,
+        stat: str,
+        fecha_creacion: str | None = None,
+    ):
+        query = """
+        UPDATE public.download_queue
+        SET
+            stat = %(stat)s::public.queue_stat,
+            lease_until = NULL,
+            fecha_creacion = COALESCE(%(fecha_creacion)s, fecha_creacion)
+        WHERE
+            periodo = %(periodo)s
+            AND claimed_by = %(worker_id)s
+        """
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                query,
+                {
+                    "periodo": periodo,
+                    "worker_id": worker_id,
+                    "stat": stat,
+                    "fecha_creacion": fecha_creacion,
+                },
+            )
+
+    def complete(self, periodo: str, worker_id: str, fecha_creacion: str | None = None):
+        """Marks the period loaded, as published on ``fecha_creacion`` if given."""
+        self._finish(periodo, worker_id, "DONE", fecha_creacion)
+
+    def fail(self, periodo: str, worker_id: str):
+        self._finish(periodo, worker_id, "FAILED")
+
+    def release(self, periodo: str, worker_id: str):
+        """Gives the period back without counting it as failed."""
+        self._finish(periodo, worker_id, "PENDING")
+
+    def lease(self, periodo: str, worker_id: str) -> "LeaseHeartbeat":
+        return LeaseHeartbeat(self, periodo, worker_id)
+
+
+class LeaseHeartbeat:
+    """Keeps a claim alive from a background thread while a period is loaded.
+
+    Once a heartbeat finds the claim gone, ``check`` raises LeaseLostError so
+    the loader stops instead of racing the worker that took the period over.
+    """
+
+    _queue: PeriodWorkQueue
+    _periodo: str
+    worker_id: str
+    _stop: threading.Event
+    _lost: threading.Event
+    _thread: threading.Thread
+
+    def __init__(self, queue: PeriodWorkQueue, periodo: str, worker_id: str) -> None:
+        self._queue = queue
+        self._periodo = periodo
+        self.worker_id = worker_id
+        self._stop = threading.Event()
+        self._lost = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"heartbeat-{periodo}", daemon=True
+        )
+
+    def _run(self):
+        interval = max(1, self._queue.lease_seconds // 3)
+        while not self._stop.wait(interval):
+            try:
+                if not self._queue.heartbeat(self._periodo, self.worker_id):
+                    self._queue.log.warning(
+                        f"[{self._periodo}] lease lost by {self.worker_id}"
+                    )
+                    self._lost.set()
+                    return
+            except Exception as e:
+                self._queue.log.error(e)
+
+    @property
+    def lost(self) -> bool:
+        return self._lost.is_set()
+
+    def check(self):
+        if self.lost:
+            raise LeaseLostError(f"[{self._periodo}] lease lost by {self.worker_id}")
+
+    def fence(self, cur: Cursor[Any]):
+        """Checks the claim inside the load transaction, see PeriodWorkQueue.fence."""
+        self.check()
+        self._queue.fence(cur, self._periodo, self.worker_id)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object):
+        self._stop.set()
+        self._thread.join()
@@ -1,14 +1,45 @@
+import csv
 import io
+import tempfile
 import unittest
 import zipfile
+from dataclasses import fields
 from pathlib import Path
+from unittest.mock import patch
 
 import psycopg
+import requests
 
-from nomina import CsvHandler, DownloadHistory, PyNomina
+from nomina import (
+    CsvHandler,
+    DownloadHistory,
+    ParallelCsvHandler,
+    PyNomina,
+    retry_delay_seconds,
+)
+from src.python import csvreader
+from src.python.changefeed import ChangeFeed, build_snapshot, diff_snapshots
 from src.python.config import AppConfig
+from src.python.httpclient import (
+    CircuitBreaker,
+    CircuitOpenError,
+    HttpClient,
+    is_upstream_failure,
+)
 from src.python.logger import Logger
-from src.python.pipeline import NominaPipeline
+from src.python.memory import MemoryBudget
+from src.python.overlaps import detect_overlaps
+from src.python.periods import AvailableData
+from src.python.pipeline import (
+    DimensionCatalog,
+    NominaPipeline,
+    PubOfficer,
+    RawCsvItem,
+)
+from src.python.postgres import NominaPgPool
+from src.python.readservice import ALL_PERIODS, QueryCache
+from src.python.timeline import PersonTimeline
+from src.python.workqueue import LeaseLostError, PeriodWorkQueue
 
 
 class TestNomina(unittest.TestCase):
@@ -50,7 +81,7 @@ class TestNomina(unittest.TestCase):
             csvHandler = CsvHandler(
                 csv_file=csv_file, encoding="iso-8859-1", log4py=self.log4py
             )
-            pipeline = NominaPipeline(csvHandler.data, self.anio_mes, self.log4py)
+            pipeline = NominaPipeline(csvHandler.batches(), self.anio_mes, self.log4py)
             # The mogrify method is only available on the ClientCursor class.
             with (
                 self.pynomina.pgpool_mgr.get_conn() as conn,
@@ -67,6 +98,601 @@ class TestNomina(unittest.TestCase):
             )
             self.pynomina.insert_download_history(download_history)
 
+    def test_person_timeline(self):
+        with self.csv_file.open("rb") as csv_file:
+            csvHandler = CsvHandler(
+                csv_file=csv_file, encoding="iso-8859-1", log4py=self.log4py
+            )
+            rows = [row for batch in csvHandler.batches() for row in batch]
+            pipeline = NominaPipeline([rows], self.anio_mes, self.log4py)
+            with (
+                self.pynomina.pgpool_mgr.get_conn() as conn,
+                psycopg.ClientCursor(conn) as cur,
+            ):
+                pipeline.persist_to_pg(cur)
+                pipeline.refresh_person_timeline(cur)
+        codigo_persona = rows[0].codigoPersona.strip()
+        timeline = PersonTimeline(self.pynomina.pgpool_mgr, self.log4py)
+        positions = timeline.get_positions([codigo_persona, "-1"])
+        self.assertEqual(positions["-1"], [])
+        self.assertIn((2017, 5), {(p.anio, p.mes) for p in positions[codigo_persona]})
+        periods = timeline.get_periods([codigo_persona])[codigo_persona]
+        self.assertIn((2017, 5), {(p.anio, p.mes) for p in periods})
+
+    def test_verify_period(self):
+        with self.csv_file.open("rb") as csv_file:
+            csvHandler = CsvHandler(
+                csv_file=csv_file, encoding="iso-8859-1", log4py=self.log4py
+            )
+            pipeline = NominaPipeline(csvHandler.batches(), self.anio_mes, self.log4py)
+            pipeline.rows_read = csvHandler.num_entries
+            with (
+                self.pynomina.pgpool_mgr.get_conn() as conn,
+                psycopg.ClientCursor(conn) as cur,
+            ):
+                pipeline.persist_to_pg(cur)
+                self.pynomina.verifier.publish(
+                    cur,
+                    self.anio_mes,
+                    pipeline.pub_officers,
+                    pipeline.rows_read,
+                    pipeline.rows_rejected,
+                    pipeline.rows_duplicated,
+                )
+        report = self.pynomina.verify_period(self.anio_mes)
+        self.assertEqual(report.status, "OK", report.discrepancies)
+        self.assertEqual(report.actual_rows, len(pipeline.pub_officers))
+        self.assertEqual(report.rows_read, csvHandler.num_entries)
+        self.assertEqual(
+            report.rows_read,
+            report.expected_rows + report.rows_rejected + report.rows_duplicated,
+        )
+
+    def test_parallel_csv_handler(self):
+        with self.csv_file.open("rb") as csv_file:
+            expected = CsvHandler(
+                csv_file=csv_file, encoding="iso-8859-1", log4py=self.log4py
+            )
+            expected_rows = [row for batch in expected.batches() for row in batch]
+        with self.csv_file.open("rb") as csv_file:
+            parallel = ParallelCsvHandler(
+                csv_file=csv_file, encoding="iso-8859-1", log4py=self.log4py
+            )
+            parallel_rows = [row for batch in parallel.batches() for row in batch]
+        self.assertEqual(parallel.num_entries, expected.num_entries)
+        self.assertEqual(parallel.hash, expected.hash)
+        self.assertEqual(parallel_rows, expected_rows)
+
+    def test_dimension_catalog(self):
+        with self.csv_file.open("rb") as csv_file:
+            csvHandler = CsvHandler(
+                csv_file=csv_file, encoding="iso-8859-1", log4py=self.log4py
+            )
+            rows = [row for batch in csvHandler.batches() for row in batch]
+        expected = NominaPipeline([rows], self.anio_mes, self.log4py)
+        catalog = DimensionCatalog()
+        first = NominaPipeline([rows], self.anio_mes, self.log4py, catalog=catalog)
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog.save(f"{tmp}/dimensions.json")
+            warm = DimensionCatalog.load(
+                f"{tmp}/dimensions.json", self.log4py.getLogger("TestNomina")
+            )
+        self.assertFalse(warm.dirty)
+        self.assertEqual(warm.sizes(), catalog.sizes())
+        second = NominaPipeline([rows], self.anio_mes, self.log4py, catalog=warm)
+        self.assertFalse(warm.dirty)
+        self.assertEqual(first._parsed_data, expected._parsed_data)
+        self.assertEqual(second._parsed_data, expected._parsed_data)
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    # Far older than any published period, so they are claimed first
+    periods = ["1900-01", "1900-02"]
+
+    def setUp(self):
+        self.log4py = Logger()
+        config = AppConfig(
+            log4py=self.log4py, config_file_path="config.toml"
+        ).read_config()
+        self.pgpool_mgr = NominaPgPool(conf=config.pg, log4py=self.log4py)
+        self.queue = PeriodWorkQueue(
+            pgpool_mgr=self.pgpool_mgr, lease_seconds=600, log4py=self.log4py
+        )
+        self._delete()
+        self.queue.enqueue([self.available(p, "2000-01-01") for p in self.periods])
+
+    def tearDown(self):
+        self._delete()
+        self.pgpool_mgr.teardown()
+
+    def _delete(self):
+        with self.pgpool_mgr.get_conn() as conn:
+            conn.execute(
+                "DELETE FROM public.download_queue WHERE periodo = ANY(%s)",
+                (self.periods,),
+            )
+
+    @staticmethod
+    def available(periodo: str, fecha_creacion: str) -> AvailableData:
+        return AvailableData(
+            dataset="nomina",
+            periodo=periodo,
+            fechaCreacion=fecha_creacion,
+            resource_url=f"https://example.org/nomina_{periodo}.zip",
+        )
+
+    def row(self, periodo: str) -> dict:
+        with self.pgpool_mgr.get_conn() as conn:
+            return conn.execute(
+                "SELECT * FROM public.download_queue WHERE periodo = %s", (periodo,)
+            ).fetchone()
+
+    def expire(self, periodo: str):
+        with self.pgpool_mgr.get_conn() as conn:
+            conn.execute(
+                """
+                UPDATE public.download_queue
+                SET lease_until = (NOW() AT TIME ZONE 'utc') - INTERVAL '1 second'
+                WHERE periodo = %s
+                """,
+                (periodo,),
+            )
+
+    def test_claim(self):
+        first = self.queue.claim("worker-a")
+        second = self.queue.claim("worker-b")
+        self.assertEqual([first.periodo, second.periodo], self.periods)
+        self.assertIsNone(self.queue.claim("worker-c", "1900-01"))
+        row = self.row("1900-01")
+        self.assertEqual((row["stat"], row["claimed_by"]), ("CLAIMED", "worker-a"))
+        self.assertTrue(self.queue.heartbeat("1900-01", "worker-a"))
+        self.assertFalse(self.queue.heartbeat("1900-01", "worker-b"))
+
+    def test_expired_lease_is_reclaimed(self):
+        self.queue.claim("worker-a", "1900-01")
+        self.expire("1900-01")
+        reclaimed = self.queue.claim("worker-b", "1900-01")
+        self.assertEqual(reclaimed.periodo, "1900-01")
+        self.assertEqual(self.row("1900-01")["attempts"], 2)
+        # The first worker finds out on its next heartbeat
+        self.assertFalse(self.queue.heartbeat("1900-01", "worker-a"))
+        self.assertTrue(self.queue.heartbeat("1900-01", "worker-b"))
+
+    def test_fence_rolls_back(self):
+        self.queue.claim("worker-a", "1900-01")
+        self.expire("1900-01")
+        self.queue.claim("worker-b", "1900-01")
+        with self.assertRaises(LeaseLostError):
+            with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE public.download_queue SET fecha_creacion = 'stale'
+                    WHERE periodo = '1900-02'
+                    """)
+                self.queue.fence(cur, "1900-01", "worker-a")
+        self.assertEqual(self.row("1900-02")["fecha_creacion"], "2000-01-01")
+        with self.pgpool_mgr.get_conn() as conn, conn.cursor() as cur:
+            self.queue.fence(cur, "1900-01", "worker-b")
+
+    def test_enqueue_and_requeue(self):
+        self.queue.claim("worker-a", "1900-01")
+        self.queue.complete("1900-01", "worker-a", "2000-02-01")
+        self.queue.claim("worker-a", "1900-02")
+        self.queue.fail("1900-02", "worker-a")
+        # Republished, only the failed period goes back and keeps its date
+        self.queue.enqueue([self.available(p, "2000-03-01") for p in self.periods])
+        self.assertEqual(
+            (self.row("1900-01")["stat"], self.row("1900-01")["fecha_creacion"]),
+            ("DONE", "2000-02-01"),
+        )
+        self.assertEqual(
+            (self.row("1900-02")["stat"], self.row("1900-02")["fecha_creacion"]),
+            ("PENDING", "2000-01-01"),
+        )
+        self.queue.requeue(["1900-01"])
+        self.assertEqual(self.row("1900-01")["stat"], "PENDING")
+        self.assertGreaterEqual(self.queue.count_claimable(), 2)
+        self.queue.claim("worker-a", "1900-01")
+        self.queue.release("1900-01", "worker-a")
+        self.assertEqual(self.row("1900-01")["stat"], "PENDING")
+
+
+def pub_officer(
+    codigo_persona: str, entidad_key: str, cargo: str, monto_devengado: int, mes=5
+) -> PubOfficer:
+    return PubOfficer(
+        codigo_evento=f"2017{mes:02}-{codigo_persona}",
+        anio=2017,
+        mes=mes,
+        codigo_persona=codigo_persona,
+        discapacidad=False,
+        nivel_key=None,
+        entidad_key=entidad_key,
+        programa_key=None,
+        proyecto_key=None,
+        unidad_responsable_key=None,
+        codigo_objecto_gasto=111,
+        fuente_financiamiento=None,
+        linea=None,
+        codigo_categoria=None,
+        cargo=cargo,
+        horas_catedra=0,
+        fecha_ingreso=None,
+        tipo_personal=None,
+        lugar=None,
+        monto_presupuestado=monto_devengado,
+        monto_devengado=monto_devengado,
+        anio_corte=None,
+        mes_corte=None,
+        fecha_corte=None,
+    )
+
+
+class TestCsvReader(unittest.TestCase):
+
+    def test_stray_quote_falls_back_to_serial(self):
+        # ab"c has a literal quote, which breaks the quote parity of the split
+        body = "h1,h2\n" + "".join(
+            'ab"c,"multi\nline"\n' if i % 3 == 0 else f'x{i},"q""{i}"\r\n'
+            for i in range(200)
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/nomina.csv"
+            with open(path, "w", encoding="iso-8859-1", newline="") as f:
+                f.write(body)
+            with patch.object(csvreader, "MIN_CHUNK_BYTES", 64):
+                header, chunks = csvreader.read_records(path, "iso-8859-1", workers=4)
+                records = [r for chunk in chunks for r in chunk]
+            with open(path, encoding="iso-8859-1") as f:
+                expected = [tuple(r.values()) for r in csv.DictReader(f)]
+        self.assertEqual(header, ["h1", "h2"])
+        self.assertEqual(records, expected)
+
+
+class TestChangeFeed(unittest.TestCase):
+
+    def test_build_snapshot(self):
+        snapshot = build_snapshot(
+            [
+                pub_officer("1", "12-MH", "DIRECTOR", 1000),
+                pub_officer("1", "11-PJ", "DOCENTE", 500),
+                pub_officer("2", "12-MH", "CHOFER", 300),
+            ]
+        )
+        self.assertEqual(snapshot["1"].entidad_keys, "11-PJ|12-MH")
+        self.assertEqual(snapshot["1"].cargos, "DIRECTOR|DOCENTE")
+        self.assertEqual(snapshot["1"].monto_devengado, 1500)
+        self.assertNotEqual(snapshot["1"].row_hash, snapshot["2"].row_hash)
+        # Row order does not change the snapshot
+        reordered = build_snapshot(
+            [
+                pub_officer("2", "12-MH", "CHOFER", 300),
+                pub_officer("1", "11-PJ", "DOCENTE", 500),
+                pub_officer("1", "12-MH", "DIRECTOR", 1000),
+            ]
+        )
+        self.assertEqual(reordered, snapshot)
+
+    def test_diff_snapshots(self):
+        previous = build_snapshot(
+            [
+                pub_officer("stays", "12-MH", "CHOFER", 1000),
+                pub_officer("moves", "12-MH", "CHOFER", 1000),
+                pub_officer("promoted", "12-MH", "CHOFER", 1000),
+                pub_officer("raised", "12-MH", "CHOFER", 1000),
+                pub_officer("leaves", "12-MH", "CHOFER", 1000),
+            ]
+        )
+        current = build_snapshot(
+            [
+                pub_officer("stays", "12-MH", "CHOFER", 1050, mes=6),
+                pub_officer("moves", "11-PJ", "CHOFER", 1000, mes=6),
+                pub_officer("promoted", "12-MH", "DIRECTOR", 1000, mes=6),
+                pub_officer("raised", "12-MH", "CHOFER", 2000, mes=6),
+                pub_officer("joins", "12-MH", "CHOFER", 1000, mes=6),
+            ]
+        )
+        changes = diff_snapshots(previous.values(), current, 2017, 6, 0.1)
+        self.assertEqual(
+            sorted((c.codigo_persona, c.change_type) for c in changes),
+            [
+                ("joins", "HIRE"),
+                ("leaves", "EXIT"),
+                ("moves", "TRANSFER"),
+                ("promoted", "CARGO"),
+                ("raised", "SALARY"),
+            ],
+        )
+        self.assertTrue(all((c.anio, c.mes) == (2017, 6) for c in changes))
+        self.assertEqual(diff_snapshots(previous.values(), previous, 2017, 5, 0.1), [])
+
+    def test_pair_lock_keys(self):
+        may = set(ChangeFeed.pair_lock_keys(2017, 5))
+        # Adjacent periods, also across a year, wait on each other
+        self.assertTrue(may & set(ChangeFeed.pair_lock_keys(2017, 6)))
+        self.assertTrue(may & set(ChangeFeed.pair_lock_keys(2017, 4)))
+        self.assertTrue(
+            set(ChangeFeed.pair_lock_keys(2016, 12))
+            & set(ChangeFeed.pair_lock_keys(2017, 1))
+        )
+        self.assertFalse(may & set(ChangeFeed.pair_lock_keys(2017, 7)))
+        self.assertFalse(may & set(ChangeFeed.pair_lock_keys(2018, 5)))
+
+
+class TestOverlaps(unittest.TestCase):
+
+    def test_several_entidades(self):
+        keys = [
+            ("1", "12-MH", "111", 1000),
+            ("1", "11-PJ", "111", 500),
+            ("2", "12-MH", "111", 300),
+        ]
+        overlaps = detect_overlaps(2017, 5, keys)
+        self.assertEqual(len(overlaps), 1)
+        self.assertEqual(overlaps[0].codigo_persona, "1")
+        self.assertEqual(overlaps[0].overlap_type, "ENTIDAD")
+        self.assertEqual(overlaps[0].items, ["11-PJ", "12-MH"])
+        self.assertEqual(overlaps[0].num_items, 2)
+        self.assertEqual(overlaps[0].monto_devengado, 1500)
+        self.assertEqual((overlaps[0].anio, overlaps[0].mes), (2017, 5))
+
+    def test_several_objetos(self):
+        keys = [
+            ("1", "12-MH", "111", 1000),
+            ("1", "12-MH", "133", 200),
+            ("1", "11-PJ", "144", 100),
+        ]
+        overlaps = detect_overlaps(2017, 5, keys)
+        self.assertEqual(
+            [(o.overlap_type, o.items) for o in overlaps],
+            [("ENTIDAD", ["11-PJ", "12-MH"]), ("OBJETO_GASTO", ["111", "133", "144"])],
+        )
+        self.assertTrue(all(o.monto_devengado == 1300 for o in overlaps))
+
+    def test_single_row(self):
+        self.assertEqual(detect_overlaps(2017, 5, [("1", "12-MH", "111", 1000)]), [])
+        # Several rows for the same entidad and objeto are no overlap either
+        keys = [("1", "12-MH", "111", 1000), ("1", "12-MH", "111", 500)]
+        self.assertEqual(detect_overlaps(2017, 5, keys), [])
+
+    def test_none_keys(self):
+        keys = [
+            ("1", None, None, None),
+            ("1", "12-MH", None, 1000),
+            ("1", "11-PJ", "111", None),
+        ]
+        overlaps = detect_overlaps(2017, 5, keys)
+        self.assertEqual(len(overlaps), 1)
+        self.assertEqual(overlaps[0].items, ["11-PJ", "12-MH"])
+        self.assertEqual(overlaps[0].monto_devengado, 1000)
+
+    def test_presorted(self):
+        keys = [
+            ("1", "12-MH", "111", 1000),
+            ("2", "12-MH", "111", 300),
+            ("1", "11-PJ", "111", 500),
+        ]
+        self.assertEqual(len(detect_overlaps(2017, 5, keys)), 1)
+        # Trusted as sorted, the split rows of "1" are not grouped
+        self.assertEqual(detect_overlaps(2017, 5, keys, presorted=True), [])
+        self.assertEqual(
+            detect_overlaps(2017, 5, sorted(keys), presorted=True),
+            detect_overlaps(2017, 5, keys),
+        )
+
+
+def http_response(status_code: int) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = "https://example.org/nomina.zip"
+    return response
+
+
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.log4py = Logger()
+
+    def client(self, breaker: CircuitBreaker | None = None) -> HttpClient:
+        return HttpClient(
+            log4py=self.log4py,
+            default_headers={},
+            default_timeout=1,
+            max_tries=3,
+            circuit_breaker=breaker,
+        )
+
+    def test_is_upstream_failure(self):
+        self.assertTrue(is_upstream_failure(requests.ConnectionError()))
+        self.assertTrue(is_upstream_failure(requests.Timeout()))
+        self.assertTrue(
+            is_upstream_failure(requests.HTTPError(response=http_response(503)))
+        )
+        self.assertFalse(
+            is_upstream_failure(requests.HTTPError(response=http_response(404)))
+        )
+        self.assertFalse(is_upstream_failure(ValueError()))
+
+    @patch("time.sleep")
+    def test_get_retries_upstream_failures(self, _sleep):
+        responses = [requests.Timeout(), http_response(502), http_response(200)]
+        with patch("requests.get", side_effect=responses) as get:
+            self.assertEqual(self.client().get("u").status_code, 200)
+        self.assertEqual(get.call_count, 3)
+
+    @patch("time.sleep")
+    def test_get_gives_up(self, _sleep):
+        with patch("requests.get", return_value=http_response(404)) as get:
+            with self.assertRaises(requests.HTTPError):
+                self.client().get("u")
+        self.assertEqual(get.call_count, 1)
+        with patch("requests.get", side_effect=requests.ConnectionError()) as get:
+            with self.assertRaises(requests.ConnectionError):
+                self.client().get("u")
+        self.assertEqual(get.call_count, 3)
+
+    @patch("time.sleep")
+    def test_download_spools_and_retries(self, _sleep):
+        body = b"PK" * 100
+        response = http_response(200)
+        response.raw = io.BytesIO(body)
+        client = self.client()
+        client.spool_max_bytes = 16
+        with patch("requests.get", side_effect=[requests.Timeout(), response]) as get:
+            with client.download("u") as archive:
+                self.assertTrue(archive._rolled)
+                self.assertEqual(archive.read(), body)
+        self.assertEqual(get.call_count, 2)
+        self.assertTrue(get.call_args.kwargs["stream"])
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(
+            failure_threshold=2, cooldown_seconds=60, log4py=self.log4py
+        )
+        with patch("time.monotonic", return_value=1000):
+            breaker.record_failure()
+            breaker.check()
+            breaker.record_failure()
+            self.assertRaises(CircuitOpenError, breaker.check)
+        with patch("time.monotonic", return_value=1060):
+            # Only one call probes the host once the cooldown is over
+            breaker.check()
+            self.assertRaises(CircuitOpenError, breaker.check)
+            # A failed probe opens it again
+            breaker.record_failure()
+            self.assertRaises(CircuitOpenError, breaker.check)
+        with patch("time.monotonic", return_value=1120):
+            breaker.check()
+            # A probe answered with a 4xx lets the next call probe
+            breaker.release()
+            breaker.check()
+            breaker.record_success()
+            breaker.check()
+            breaker.check()
+
+    def test_open_circuit_fails_fast(self):
+        breaker = CircuitBreaker(
+            failure_threshold=1, cooldown_seconds=60, log4py=self.log4py
+        )
+        breaker.record_failure()
+        with patch("requests.get") as get:
+            with self.assertRaises(CircuitOpenError):
+                self.client(breaker).get("u")
+        get.assert_not_called()
+
+    def test_retry_delay_seconds(self):
+        delays = [retry_delay_seconds(n, 900, 3600) for n in range(1, 6)]
+        self.assertEqual(delays, [900, 1800, 3600, 3600, 3600])
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def test_invalidate(self):
+        cache = QueryCache(max_entries=10)
+        cache.get_or_compute(("totals", "2017-05"), "2017-05", lambda: 1)
+        cache.get_or_compute(("totals", "2017-06"), "2017-06", lambda: 2)
+        cache.get_or_compute(("history",), ALL_PERIODS, lambda: 3)
+        self.assertEqual(cache.invalidate("2017-05"), 2)
+        self.assertEqual(
+            cache.get_or_compute(("totals", "2017-05"), "2017-05", lambda: 4), 4
+        )
+        self.assertEqual(
+            cache.get_or_compute(("totals", "2017-06"), "2017-06", lambda: 5), 2
+        )
+        self.assertEqual(cache.get_or_compute(("history",), ALL_PERIODS, lambda: 6), 6)
+
+    def test_invalidated_while_computing(self):
+        cache = QueryCache(max_entries=10)
+
+        def compute():
+            # The period is reloaded while its query runs
+            cache.invalidate("2017-05")
+            return "stale"
+
+        key = ("totals", "2017-05")
+        self.assertEqual(cache.get_or_compute(key, "2017-05", compute), "stale")
+        self.assertEqual(cache.get_or_compute(key, "2017-05", lambda: "new"), "new")
+
+    def test_clear(self):
+        cache = QueryCache(max_entries=10)
+        cache.get_or_compute(("totals", "2017-05"), "2017-05", lambda: 1)
+        cache.clear()
+        self.assertEqual(
+            cache.get_or_compute(("totals", "2017-05"), "2017-05", lambda: 2), 2
+        )
+
+        def compute():
+            # Nothing of the period is cached yet when the cache is cleared
+            cache.clear()
+            return "stale"
+
+        key = ("totals", "2017-06")
+        self.assertEqual(cache.get_or_compute(key, "2017-06", compute), "stale")
+        self.assertEqual(cache.get_or_compute(key, "2017-06", lambda: "new"), "new")
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def test_disabled_without_proc(self):
+        with patch.object(MemoryBudget, "rss_mb", return_value=None):
+            budget = MemoryBudget(max_rss_mb=100, log4py=Logger())
+            self.assertFalse(budget.enabled)
+            self.assertEqual(budget.next_batch_size(10, 1, 100), 10)
+            budget.wait_for_headroom("2017-05")
+
+    def test_peak_per_period(self):
+        with patch.object(
+            MemoryBudget, "rss_mb", side_effect=[40, 100, 50, 300, 80, 90]
+        ):
+            budget = MemoryBudget(max_rss_mb=0, log4py=Logger())
+            budget.reset_peak("2017-05")
+            budget.reset_peak("2017-06")
+            budget.sample()
+            with self.assertLogs("MemoryBudget", "INFO") as logs:
+                budget.report("2017-05")
+            budget.reset_peak("2017-07")
+        self.assertIn("[2017-05] peak_rss=300MB", logs.output[0])
+        self.assertEqual(budget._peaks, {"2017-06": (50, 300), "2017-07": (90, 90)})
+        self.assertEqual(budget._estimate_mb, 200)
+
+    @patch("time.sleep")
+    def test_admission_by_estimate(self, _sleep):
+        # RSS never falls back to the baseline once a period was loaded
+        with patch.object(MemoryBudget, "rss_mb", return_value=100):
+            budget = MemoryBudget(max_rss_mb=1000, log4py=Logger())
+            budget.wait_timeout = 0
+            budget.wait_for_headroom("w0")
+            budget.reset_peak("2017-05")
+        with patch.object(MemoryBudget, "rss_mb", return_value=350):
+            # Unmeasured, a second period waits for the first one
+            with self.assertLogs("MemoryBudget", "WARNING"):
+                budget.wait_for_headroom("w1")
+            budget.release("w1")
+            budget.report("2017-05")
+            budget.release("w0")
+            # 100 + 3 * 250 fits in 850MB, a fourth period does not
+            with self.assertNoLogs("MemoryBudget", "INFO"):
+                for worker in ["w0", "w1", "w2"]:
+                    budget.wait_for_headroom(worker)
+            with self.assertLogs("MemoryBudget", "WARNING"):
+                budget.wait_for_headroom("w3")
+
+    def test_csv_batches_follow_budget(self):
+        columns = [f.name for f in fields(RawCsvItem)]
+        body = io.StringIO()
+        writer = csv.DictWriter(body, columns)
+        writer.writeheader()
+        for i in range(10):
+            writer.writerow({c: str(i) for c in columns})
+        budget = MemoryBudget(max_rss_mb=0, log4py=Logger())
+        csv_file = io.BytesIO(body.getvalue().encode("iso-8859-1"))
+        handler = CsvHandler(csv_file, "iso-8859-1", Logger(), budget=budget)
+        handler.batch_size = 2
+        with patch.object(budget, "next_batch_size", side_effect=[4, 1, 1, 1, 1, 1]):
+            sizes = [len(batch) for batch in handler.batches()]
+        self.assertEqual(sizes, [2, 4, 1, 1, 1, 1])
+        self.assertEqual(handler.num_entries, 10)
+
 
 if __name__ == '__main__':
     unittest.main()